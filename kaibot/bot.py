@@ -1,14 +1,20 @@
+import asyncio
 import logging
 import os
+import time
 
 import aiohttp
-from discord import Activity, ActivityType, DMChannel, AllowedMentions, Intents
+from discord import Activity, ActivityType, AllowedMentions, Intents
 from discord.ext import commands
-from motor.motor_asyncio import AsyncIOMotorClient
 
 from . import config
 from .i18n import current_language
-from .utils.database import DatabaseManager
+from .utils import backends
+from .utils.channel_activity import ChannelActivity
+from .utils.database import MISSING, DatabaseManager, LRUCache
+from .utils.guild_config import GuildConfig, PrefixMatcher, current_guild_config
+from .utils.interactions import InteractionRouter
+from .utils.scheduler import DeadlineScheduler
 
 log = logging.getLogger('kaibot')
 
@@ -24,10 +30,24 @@ class KaiBOT(commands.Bot):
 
         self.uptime = None
         self.session = aiohttp.ClientSession()
-
-        self.db_client = AsyncIOMotorClient(os.environ['MONGO_URI'])
-        self.db = DatabaseManager('KaiBOT', client=self.db_client)
-        self.db.create_collection('Guilds', {'prefixes': None, 'language': None})
+        self.scheduler = DeadlineScheduler(self.loop)
+        self.interactions = InteractionRouter(self)
+        self.channel_activity = ChannelActivity(self)
+
+        # MONGO_URI is kept for compatibility.
+        db_uri = os.getenv('DATABASE_URI') or os.environ['MONGO_URI']
+        self.db = DatabaseManager(backends.from_uri(db_uri, 'KaiBOT'))
+        self.db.create_collection(
+            'Guilds',
+            {'prefixes': None, 'language': None},
+            # Big enough to keep every guild prefetched on READY.
+            cache_size=10_000,
+            write_behind=config.DB_WRITE_BEHIND,
+            id_type=str if config.DB_ID_MODE == 'str' else int,
+            legacy_ids=config.DB_ID_MODE == 'both',
+        )
+        if config.DB_WATCH_CHANGES:
+            self.db.guilds.start_watching()
 
         self.load_all_extensions(config.EXTENSIONS)
 
@@ -36,6 +56,23 @@ class KaiBOT(commands.Bot):
 
         self._flags_cache = {}
 
+        # Prefixes -> PrefixMatcher, so they're only compiled when the
+        # prefixes change. Most guilds share the default ones.
+        self._matchers = LRUCache(1000)
+
+        # Messages skipped by on_message because they can't be commands,
+        # and the ones passed to process_commands.
+        self.skipped_messages = 0
+        self.processed_messages = 0
+
+        # Guild ids to be prefetched, filled by READY and GUILD_CREATE.
+        self._prefetch_ids = set()
+        self._prefetch_task = None
+        # From the first queued id to the end of the first prefetch that
+        # finishes after READY.
+        self.warm_up_time = None
+        self._warm_up_start = None
+
         self.add_check(self.send_messages_check)
 
     # - HELPERS -
@@ -50,6 +87,8 @@ class KaiBOT(commands.Bot):
 
     async def close(self):
         log.info('Closing...')
+        self.scheduler.close()
+        await self.db.close()
         await self.session.close()
         await super().close()
 
@@ -88,24 +127,117 @@ class KaiBOT(commands.Bot):
 
         return flags
 
-    async def get_language_for(self, guild):
+    def get_mentions(self):
+        return (f'<@{self.user.id}>', f'<@!{self.user.id}>')
+
+    def get_prefix_matcher(self, prefixes):
+        """Returns the compiled matcher for the prefixes and both mentions."""
+        matcher = self._matchers.get(prefixes)
+        if matcher is MISSING:
+            mentions = tuple(mention + ' ' for mention in self.get_mentions())
+            matcher = self._matchers.insert(prefixes, PrefixMatcher(mentions + prefixes))
+        return matcher
+
+    def could_be_command(self, message):
+        """
+        Quick check done before anything else, using only cached data.
+        May give false positives, never false negatives.
+        """
+        content = message.content
+        if not content:
+            return False
+
+        guild = message.guild
+        if guild is None:
+            return True
+
+        doc = self.db.guilds.get_cached(guild.id)
+        if doc is MISSING:
+            # Not loaded yet, let the slow path decide.
+            return True
+
+        prefixes = config.PREFIXES
+        if doc and doc.prefixes:
+            prefixes = tuple(doc.prefixes)
+
+        return self.get_prefix_matcher(prefixes).could_match(content)
+
+    async def get_guild_config(self, guild):
+        """Resolves the prefixes and language of a guild (or DM, if None)."""
+        if guild is None:
+            prefixes = config.PREFIXES
+            language = config.DEFAULT_LANGUAGE
+            # No prefix is needed in DMs.
+            matcher = self.get_prefix_matcher(prefixes + ('',))
+            return GuildConfig(None, prefixes, language, matcher)
+
         doc = await self.db.guilds.find(guild.id)
-        if doc and doc.language:
-            return doc.language
 
-        return config.DEFAULT_LANGUAGE
+        prefixes = config.PREFIXES
+        language = config.DEFAULT_LANGUAGE
+        if doc:
+            if doc.prefixes:
+                prefixes = tuple(doc.prefixes)
+            if doc.language:
+                language = doc.language
+
+        return GuildConfig(guild.id, prefixes, language, self.get_prefix_matcher(prefixes))
+
+    async def _get_current_guild_config(self, guild):
+        """Reuses the config resolved for the current message, if any."""
+        guild_config = current_guild_config.get()
+        guild_id = guild.id if guild else None
+        if guild_config is None or guild_config.guild_id != guild_id:
+            guild_config = await self.get_guild_config(guild)
+        return guild_config
+
+    async def get_language_for(self, guild):
+        guild_config = await self._get_current_guild_config(guild)
+        return guild_config.language
 
     async def prefix_getter(self, bot, message):
-        if isinstance(message.channel, DMChannel):
-            return commands.when_mentioned_or(*config.PREFIXES, '')(bot, message)
+        guild_config = await self._get_current_guild_config(message.guild)
 
-        prefixes = config.PREFIXES
+        prefix = guild_config.matcher(message.content)
+        if prefix is not None:
+            return prefix
 
-        doc = await self.db.guilds.find(message.guild.id)
-        if doc and doc.prefixes:
-            prefixes = doc.prefixes
+        return guild_config.matcher.prefixes
+
+    async def get_context(self, message, *, cls=commands.Context):
+        ctx = await super().get_context(message, cls=cls)
+
+        ctx.guild_config = await self._get_current_guild_config(message.guild)
+
+        return ctx
+
+    def queue_prefetch(self, guild_id):
+        if self._warm_up_start is None:
+            self._warm_up_start = time.perf_counter()
+
+        self._prefetch_ids.add(guild_id)
+        if self._prefetch_task is None or self._prefetch_task.done():
+            self._prefetch_task = self.loop.create_task(self._prefetch_guilds())
+
+    async def _prefetch_guilds(self):
+        # Let the GUILD_CREATEs pile up, so they go in a few queries.
+        await asyncio.sleep(1)
+
+        start = time.perf_counter()
+        count = 0
+        while self._prefetch_ids:
+            ids, self._prefetch_ids = self._prefetch_ids, set()
+            try:
+                count += await self.db.guilds.prefetch(ids)
+            except Exception:
+                log.error('Failed to prefetch guild documents.', exc_info=True)
+        end = time.perf_counter()
+        elapsed = end - start
 
-        return commands.when_mentioned_or(*prefixes)(bot, message)
+        if self.warm_up_time is None and self.is_ready():
+            self.warm_up_time = end - self._warm_up_start
+
+        log.debug(f'Prefetched {count} guild documents in {elapsed:.2f}s.')
 
     def send_messages_check(self, ctx):
         if not ctx.me.permissions_in(ctx.channel).send_messages:
@@ -116,8 +248,34 @@ class KaiBOT(commands.Bot):
 
     async def on_ready(self):
         log.info('Bot is ready.')
+        for guild in self.guilds:
+            self.queue_prefetch(guild.id)
+
+    async def on_guild_available(self, guild):
+        self.queue_prefetch(guild.id)
+
+    async def on_guild_join(self, guild):
+        self.queue_prefetch(guild.id)
 
     async def on_message(self, message):
-        if not message.author.bot:
-            current_language.set(await self.get_language_for(message.guild))
-            await self.process_commands(message)
+        if message.author.bot:
+            return
+
+        if not self.could_be_command(message):
+            self.skipped_messages += 1
+            return
+
+        guild_config = await self.get_guild_config(message.guild)
+        current_guild_config.set(guild_config)
+        current_language.set(guild_config.language)
+
+        if message.content in self.get_mentions():
+            self.dispatch('bare_mention', message, guild_config)
+            return
+
+        if guild_config.matcher(message.content) is None:
+            self.skipped_messages += 1
+            return
+
+        self.processed_messages += 1
+        await self.process_commands(message)
@@ -10,7 +10,7 @@ from rich.columns import Columns
 from rich.panel import Panel
 from rich.table import Table
 
-from ..i18n import Translator, current_language
+from ..i18n import Translator
 from .. import config
 
 ASCII_ART = r"""
@@ -151,21 +151,13 @@ class BotEvents(commands.Cog):
         await channel.send(embed=embed)
 
     @commands.Cog.listener()
-    async def on_message(self, message):
-        if message.content == message.guild.me.mention:
-            prefixes = config.PREFIXES
-
-            guild_doc = await self.bot.db.guilds.find(message.guild.id)
-            current_language.set(await self.bot.get_language_for(message.guild))
-
-            prefixes = config.PREFIXES
-
-            if guild_doc and guild_doc.prefixes:
-                prefixes = guild_doc.prefixes
-
-            await message.reply(
-                _('Olá! Sou KaiBOT, o prefixo desse servidor é `{prefix}`.', prefix=prefixes[0])
+    async def on_bare_mention(self, message, guild_config):
+        await message.reply(
+            _(
+                'Olá! Sou KaiBOT, o prefixo desse servidor é `{prefix}`.',
+                prefix=guild_config.prefixes[0],
             )
+        )
 
 
 def setup(bot):
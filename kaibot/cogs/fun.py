@@ -1,5 +1,4 @@
 import sys
-from asyncio import TimeoutError
 
 import discord
 import discord.http
@@ -7,8 +6,8 @@ from discord.ext import commands
 
 from .. import config
 from ..i18n import Translator
-from ..utils import custom, escape_text
-from ..utils.interactions import wait_for_click
+from ..utils import custom, escape_text, format_list
+from .games.mnk import VARIANTS, MNKIntegration
 from .games.ttt import TTTIntegration
 
 _ = Translator(__name__)
@@ -17,13 +16,74 @@ _ = Translator(__name__)
 class Fun(custom.Cog, translator=_):
     """Comandos de diversão."""
 
+    TTT_DIFFICULTIES = {
+        'fácil': 'easy',
+        'facil': 'easy',
+        'easy': 'easy',
+        'médio': 'medium',
+        'medio': 'medium',
+        'medium': 'medium',
+        'difícil': 'hard',
+        'dificil': 'hard',
+        'hard': 'hard',
+    }
+
     def __init__(self, bot):
         self.bot = bot
         self._ttt_game = TTTIntegration(bot)
-        self.waiting = []
+        self._mnk_game = MNKIntegration(bot)
+        # Members with a pending confirmation -> its Listener.
+        self.waiting = {}
+        self.__tasks = set()
 
     def cog_unload(self):
         self._ttt_game.destroy()
+        self._mnk_game.destroy()
+        for listener in self.waiting.values():
+            listener.cancel()
+        for task in self.__tasks:
+            task.cancel()
+
+    def _create_task(self, coro):
+        task = self.bot.loop.create_task(coro)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    def _in_game(self, member_id):
+        return member_id in self._ttt_game or member_id in self._mnk_game
+
+    async def _challenge(self, ctx, player, text, integration, **options):
+        """Asks `player` to play against the author, then starts the game."""
+        if self._in_game(ctx.author.id):
+            return await ctx.send(_('Você já está em um jogo.'))
+        if self._in_game(player.id) or player.id in self.waiting:
+            return await ctx.send(
+                _('**{player}** já está em um jogo.', player=escape_text(player.display_name))
+            )
+
+        msg_id = await self._send_confirmation(ctx.channel.id, text)
+        msg = self.bot._connection._get_message(int(msg_id))
+
+        def answer(choice):
+            self._create_task(
+                self._on_answer(msg, text, ctx.author, player, choice, integration, options)
+            )
+
+        self.waiting[player.id] = self.bot.interactions.listen(
+            msg.id, player.id, answer, timeout=60, on_timeout=lambda: answer(None)
+        )
+
+    async def _on_answer(self, msg, text, author, player, choice, integration, options):
+        self.waiting.pop(player.id, None)
+
+        if choice is None:
+            return await msg.edit(content=text + '\n- ' + _('Tempo excedido.'))
+
+        if choice == 'choice_0':
+            not_accepted_text = _('{player} não aceitou.', player=player.mention)
+            return await msg.edit(content=text + '\n- ' + not_accepted_text)
+
+        await integration.start(msg, author, player, **options)
 
     async def _send_confirmation(self, channel_id, text):
         route = discord.http.Route('POST', '/channels/{channel_id}/messages', channel_id=channel_id)
@@ -41,44 +101,65 @@ class Fun(custom.Cog, translator=_):
         data = await self.bot.http.request(route, json=payload)
         return data['id']
 
-    @commands.command(aliases=['tictactoe', 'jogodavelha', 'jdv'])
+    @commands.group(aliases=['tictactoe', 'jogodavelha', 'jdv'], invoke_without_command=True)
     @commands.guild_only()
     @commands.bot_has_permissions(add_reactions=True)
     async def ttt(self, ctx, *, player: discord.Member):
         """Começa um jogo da velha."""
+        if player == ctx.me:
+            return await self.ttt_bot(ctx)
         if player.bot:
             return await ctx.send(_('O outro jogador não pode ser um bot.'))
         if ctx.author == player:
             return await ctx.send(_('Você não pode jogar com você mesmo.'))
-        if ctx.author.id in self._ttt_game:
-            return await ctx.send(_('Você já está em um jogo.'))
-        if player.id in self._ttt_game or player.id in self.waiting:
-            return await ctx.send(
-                _('**{player}** já está em um jogo.', player=escape_text(player.display_name))
-            )
 
         text = _(
             '{player}, deseja jogar Jogo da Velha contra {author}?',
             author=ctx.author.mention,
             player=player.mention,
         )
-        msg_id = await self._send_confirmation(ctx.channel.id, text)
-        msg = self.bot._connection._get_message(int(msg_id))
+        await self._challenge(ctx, player, text, self._ttt_game)
 
-        self.waiting.append(player.id)
+    @ttt.command(name='bot')
+    async def ttt_bot(self, ctx, difficulty='difícil'):
+        """
+        Começa um jogo da velha contra mim.
 
-        try:
-            choice = await wait_for_click(self.bot, msg.id, player.id, timeout=60)
-        except TimeoutError:
-            return await msg.edit(content=text + '\n- ' + _('Tempo excedido.'))
-        finally:
-            self.waiting.remove(player.id)
+        As dificuldades são `fácil`, `médio` e `difícil`.
+        """
+        level = self.TTT_DIFFICULTIES.get(difficulty.casefold())
+        if level is None:
+            difficulties = format_list(('`fácil`', '`médio`', '`difícil`'), style='or')
+            return await ctx.send(_('Escolha entre {difficulties}.', difficulties=difficulties))
+        if self._in_game(ctx.author.id) or ctx.author.id in self.waiting:
+            return await ctx.send(_('Você já está em um jogo.'))
 
-        if choice == 'choice_0':
-            not_accepted_text = _('{player} não aceitou.', player=player.mention)
-            return await msg.edit(content=text + '\n- ' + not_accepted_text)
+        msg = await ctx.send(_('Começando...'))
+        await self._ttt_game.start(msg, ctx.author, ctx.me, difficulty=level)
 
-        await self._ttt_game.start(msg, ctx.author, player)
+    @commands.command(aliases=['kemlinha'])
+    @commands.guild_only()
+    async def mnk(self, ctx, variant: str.lower, *, player: discord.Member):
+        """
+        Começa um jogo de k em linha.
+
+        As variantes são `connect4` (lig 4), `gomoku`, `4x4` e `5x5`.
+        """
+        if variant not in VARIANTS:
+            variants = format_list([f'`{name}`' for name in VARIANTS], style='or')
+            return await ctx.send(_('Escolha entre {variants}.', variants=variants))
+        if player.bot:
+            return await ctx.send(_('O outro jogador não pode ser um bot.'))
+        if ctx.author == player:
+            return await ctx.send(_('Você não pode jogar com você mesmo.'))
+
+        text = _(
+            '{player}, deseja jogar {variant} contra {author}?',
+            variant=variant,
+            author=ctx.author.mention,
+            player=player.mention,
+        )
+        await self._challenge(ctx, player, text, self._mnk_game, variant=variant)
 
     async def _create_application_invite(self, channel_id, application_id, app_name):
         # We're making the request ourselves because d.py doesn't
@@ -142,4 +223,5 @@ def setup(bot):
 
 
 def teardown(bot):
-    sys.modules.pop('kaibot.cogs.games.ttt')
+    sys.modules.pop('kaibot.cogs.games.ttt', None)
+    sys.modules.pop('kaibot.cogs.games.mnk', None)
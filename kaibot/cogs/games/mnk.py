@@ -0,0 +1,267 @@
+from functools import lru_cache
+
+from ...i18n import Translator
+from .ttt import CUSTOM_ID_PREFIX, EMOJIS, EMPTY_LABEL, BoardIntegration, Players
+
+_ = Translator(__name__)
+
+# Implementation #
+
+
+class MNKImplementation:
+    """
+    A k-in-a-row game on a width x height board. With gravity, the moves
+    are columns and the pieces fall to the bottom (Connect Four).
+
+    The boards are ints with one bit per cell, column by column from the
+    bottom, plus an always empty bit on top of each column. The empty bit
+    stops the line checks from wrapping to the next column.
+    """
+
+    __slots__ = ('width', 'height', 'k', 'gravity', 'boards', 'heights', 'moves', 'turn', 'winner')
+
+    def __init__(self, width, height, k, *, gravity=False):
+        if not (1 <= k <= max(width, height)):
+            raise ValueError('k should fit in the board.')
+
+        self.width = width
+        self.height = height
+        self.k = k
+        self.gravity = gravity
+        self.boards = [0, 0]
+        # The next free row of each column, only used with gravity.
+        self.heights = [0] * width
+        self.moves = 0
+        self.turn = Players.X
+        # None while playing, Players.UNSET on a tie.
+        self.winner = None
+
+    def _bit(self, n):
+        """The bit of the cell n, counting from the top left."""
+        row, column = divmod(n, self.width)
+        return 1 << (column * (self.height + 1) + (self.height - 1 - row))
+
+    def get(self, n):
+        bit = self._bit(n)
+        if self.boards[Players.X] & bit:
+            return Players.X
+        if self.boards[Players.O] & bit:
+            return Players.O
+        return Players.UNSET
+
+    @property
+    def table(self):
+        return tuple(
+            tuple(self.get(row * self.width + column) for column in range(self.width))
+            for row in range(self.height)
+        )
+
+    @property
+    def valid_moves(self):
+        if self.winner is not None:
+            return ()
+        if self.gravity:
+            return tuple(c for c in range(self.width) if self.heights[c] < self.height)
+        return tuple(n for n in range(self.width * self.height) if self.get(n) == Players.UNSET)
+
+    def make_move(self, n):
+        """Plays on the cell n, or the column n with gravity."""
+        if self.winner is not None:
+            raise ValueError('The game is over.')
+
+        if self.gravity:
+            if not (0 <= n < self.width):
+                raise ValueError(f'n should be in range({self.width})')
+            if self.heights[n] == self.height:
+                raise ValueError(f'{n} is full.')
+            bit = 1 << (n * (self.height + 1) + self.heights[n])
+            self.heights[n] += 1
+        else:
+            if not (0 <= n < self.width * self.height):
+                raise ValueError(f'n should be in range({self.width * self.height})')
+            bit = self._bit(n)
+            if (self.boards[0] | self.boards[1]) & bit:
+                raise ValueError(f'{n} is already taken.')
+
+        self.boards[self.turn] |= bit
+        self.moves += 1
+
+        if self._is_win(self.boards[self.turn], bit):
+            self.winner = self.turn
+        elif self.moves == self.width * self.height:
+            self.winner = Players.UNSET
+
+        self.turn = _OTHER_PLAYER[self.turn]
+
+    def _is_win(self, board, bit):
+        """Only checks the lines through the last move, so O(k)."""
+        k = self.k
+        # Vertical, horizontal and both diagonals.
+        for shift in (1, self.height + 1, self.height, self.height + 2):
+            count = 1
+            probe = bit << shift
+            while count < k and board & probe:
+                count += 1
+                probe <<= shift
+            probe = bit >> shift
+            while count < k and board & probe:
+                count += 1
+                probe >>= shift
+            if count >= k:
+                return True
+        return False
+
+    @property
+    def key(self):
+        return self.boards[0] | self.boards[1] << (self.width * (self.height + 1))
+
+
+_OTHER_PLAYER = (Players.O, Players.X)
+
+# (width, height, k, gravity), by the names accepted by the command.
+# Without gravity, the width can't be over 24 (the column select also
+# has a back option).
+VARIANTS = {
+    'connect4': (7, 6, 4, True),
+    'gomoku': (15, 15, 5, False),
+    '4x4': (4, 4, 4, False),
+    '5x5': (5, 5, 4, False),
+}
+
+# Integration #
+
+# Discord allows 5 action rows of 5 buttons.
+MAX_GRID = 5
+
+ROW_SELECT_ID = 'mnk_row'
+COLUMN_SELECT_ID = 'mnk_column'
+BACK_VALUE = 'back'
+
+CELLS = {Players.X: 'X', Players.O: 'O', Players.UNSET: '·'}
+
+
+def column_name(column):
+    return chr(ord('A') + column)
+
+
+@lru_cache(maxsize=1024)
+def _build_button(n, value, disabled, label=None):
+    button = {'type': 2, 'custom_id': CUSTOM_ID_PREFIX + str(n + 1), 'disabled': disabled}
+    if label is not None:
+        button['style'] = 2
+        button['label'] = label
+    elif value == Players.UNSET:
+        button['style'] = 2
+        button['label'] = EMPTY_LABEL
+    else:
+        button['style'] = 1
+        button['emoji'] = EMOJIS[value]
+    return button
+
+
+def _rows(buttons, per_row=MAX_GRID):
+    return tuple(
+        {'type': 1, 'components': tuple(buttons[i : i + per_row])}
+        for i in range(0, len(buttons), per_row)
+    )
+
+
+class MNKIntegration(BoardIntegration):
+    """
+    Boards that fit the component grid are buttons, like TTT. Bigger
+    ones are drawn in the message and played with a row select followed
+    by a column select, Connect Four only needs a button per column.
+    """
+
+    def __init__(self, bot):
+        super().__init__(bot)
+        # game -> the row picked in the row select.
+        self.selected_rows = {}
+
+    def new_game(self, *, variant):
+        width, height, k, gravity = VARIANTS[variant]
+        return MNKImplementation(width, height, k, gravity=gravity)
+
+    def _end(self, info):
+        self.selected_rows.pop(info.game, None)
+        super()._end(info)
+
+    @staticmethod
+    def _fits_grid(game):
+        return not game.gravity and game.width <= MAX_GRID and game.height <= MAX_GRID
+
+    def get_content(self, info, txt):
+        game = info.game
+        if self._fits_grid(game):
+            return txt
+
+        lines = ['   ' + ' '.join(column_name(c) for c in range(game.width))]
+        for row, cells in enumerate(game.table):
+            lines.append(f'{row + 1:>2} ' + ' '.join(CELLS[cell] for cell in cells))
+        board = '\n'.join(lines)
+        return f'{txt}\n```\n{board}\n```'
+
+    def get_components(self, info, disabled):
+        game = info.game
+        if game.gravity:
+            free = game.valid_moves
+            return _rows(
+                [
+                    _build_button(c, Players.UNSET, disabled or c not in free, column_name(c))
+                    for c in range(game.width)
+                ]
+            )
+
+        if self._fits_grid(game):
+            return _rows(
+                [_build_button(n, game.get(n), disabled) for n in range(game.width * game.height)],
+                game.width,
+            )
+
+        row = self.selected_rows.get(game)
+        if row is None:
+            select = {
+                'type': 3,
+                'custom_id': ROW_SELECT_ID,
+                'placeholder': _('Escolha a linha'),
+                'disabled': disabled,
+                'options': [
+                    {'label': _('Linha {row}', row=r + 1), 'value': str(r)}
+                    for r in range(game.height)
+                    if any(game.get(r * game.width + c) == Players.UNSET for c in range(game.width))
+                ],
+            }
+        else:
+            options = [
+                {'label': f'{column_name(c)}{row + 1}', 'value': str(c)}
+                for c in range(game.width)
+                if game.get(row * game.width + c) == Players.UNSET
+            ]
+            options.append({'label': _('Voltar'), 'value': BACK_VALUE})
+            select = {
+                'type': 3,
+                'custom_id': COLUMN_SELECT_ID,
+                'placeholder': _('Escolha a coluna'),
+                'disabled': disabled,
+                'options': options,
+            }
+        return ({'type': 1, 'components': (select,)},)
+
+    async def get_move(self, info, custom_id, values):
+        game = info.game
+        if custom_id.startswith(CUSTOM_ID_PREFIX):
+            return await super().get_move(info, custom_id, values)
+
+        if not values:
+            return None
+
+        if custom_id == ROW_SELECT_ID:
+            self.selected_rows[game] = int(values[0])
+        elif custom_id == COLUMN_SELECT_ID:
+            row = self.selected_rows.pop(game, None)
+            if values[0] != BACK_VALUE and row is not None:
+                return row * game.width + int(values[0])
+
+        # Only the select changed.
+        await self.edit_message(info, self.get_status(info))
+        return None
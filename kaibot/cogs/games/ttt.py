@@ -1,12 +1,12 @@
-import asyncio
+import random
 from enum import IntEnum
-from typing import NamedTuple
+from functools import lru_cache
+from typing import NamedTuple, Optional
 
 import discord
 import discord.http
 
 from ...i18n import Translator
-from ...utils.interactions import ack_interaction, wait_for_click
 
 _ = Translator(__name__)
 
@@ -23,116 +23,285 @@ class GameInfo(NamedTuple):
     message: discord.Message
     game: 'TTTImplementation'
     players: tuple[discord.Member, discord.Member]
+    # Only used when one of the players is a bot.
+    difficulty: Optional[str] = None
 
 
 # Implementation #
+
+# Bit n is the position n, counting from the top left.
+WIN_MASKS = (
+    0b000_000_111,  # Rows
+    0b000_111_000,
+    0b111_000_000,
+    0b001_001_001,  # Columns
+    0b010_010_010,
+    0b100_100_100,
+    0b100_010_001,  # Diagonals
+    0b001_010_100,
+)
+FULL_BOARD = 0b111_111_111
+
+# The masks each position is part of, so a move checks at most 4.
+MASKS_BY_POSITION = tuple(tuple(m for m in WIN_MASKS if m & (1 << n)) for n in range(9))
+
+_OTHER_PLAYER = (Players.O, Players.X)
+
+
 class TTTImplementation:
-    __slots__ = ('table', 'turn')
+    """
+    The board is kept as one 9 bit integer per player. The winner is
+    updated on each move, so reading it is free.
+    """
 
-    def __init__(self):
-        self.table = (
-            [Players.UNSET, Players.UNSET, Players.UNSET],
-            [Players.UNSET, Players.UNSET, Players.UNSET],
-            [Players.UNSET, Players.UNSET, Players.UNSET],
-        )
+    __slots__ = ('boards', 'turn', 'winner')
 
+    def __init__(self):
+        self.boards = [0, 0]
         self.turn = Players.X
 
-    def _valid_moves_iter(self):
-        for column, rows in enumerate(self.table):
-            for row, value in enumerate(rows):
-                if value == Players.UNSET:
-                    yield (3 * column + 1) + row
+        # None while playing, UNSET if it's a draw.
+        self.winner = None
 
-    def _get_position(self, n):
-        return self.table[n // 3][n % 3]
+    def get(self, n):
+        bit = 1 << n
+        if self.boards[Players.X] & bit:
+            return Players.X
+        if self.boards[Players.O] & bit:
+            return Players.O
+        return Players.UNSET
+
+    @property
+    def table(self):
+        return tuple(tuple(self.get(3 * column + row) for row in range(3)) for column in range(3))
 
     @property
     def valid_moves(self):
-        return tuple(self._valid_moves_iter())
+        # These are 1-based, unlike make_move.
+        taken = self.boards[0] | self.boards[1]
+        return tuple(n + 1 for n in range(9) if not taken & (1 << n))
 
     def make_move(self, n):
         if not (0 <= n < 9):
             raise ValueError('n should be in range(9)')
 
-        if self._get_position(n) != Players.UNSET:
+        if self.winner is not None:
+            raise ValueError('The game is over.')
+
+        bit = 1 << n
+        if (self.boards[0] | self.boards[1]) & bit:
             raise ValueError(f'{n} is already taken.')
 
-        column = n // 3
-        row = n % 3
+        player = self.turn
+        board = self.boards[player] | bit
+        self.boards[player] = board
+
+        for mask in MASKS_BY_POSITION[n]:
+            if board & mask == mask:
+                self.winner = player
+                break
+        else:
+            if self.boards[0] | self.boards[1] == FULL_BOARD:
+                self.winner = Players.UNSET
 
-        self.table[column][row] = self.turn
-        self.turn = Players(not self.turn)
+        self.turn = _OTHER_PLAYER[player]
 
     @property
-    def winner(self):
-        check = self._get_position
-
-        # Check vertical
-        for n in range(3):
-            if check(n) == check(n + 3) == check(n + 6) != Players.UNSET:
-                return check(n)
-
-        # Check horizontal:
-        for n in range(3):
-            col = 3 * n
-            if check(col) == check(col + 1) == check(col + 2) != Players.UNSET:
-                return check(col)
-
-        # Check diagonals
-        if check(0) == check(4) == check(8) != Players.UNSET:
-            return check(0)
-        if check(2) == check(4) == check(6) != Players.UNSET:
-            return check(2)
+    def key(self):
+        """Identifies the state, used by the solved table."""
+        return self.boards[0] | self.boards[1] << 9
+
+
+# Solver #
+
+WIN, DRAW, LOSS = 0, 1, 2
+
+
+def _solve():
+    """
+    Solves every reachable non-final state. Returns {key: moves}, where
+    moves[WIN], moves[DRAW] and moves[LOSS] are the moves that lead to
+    each result, for the player to move.
+    """
+    table = {}
+
+    def solve(boards, player):
+        key = boards[0] | boards[1] << 9
+        if key in table:
+            moves = table[key]
+            return WIN if moves[WIN] else DRAW if moves[DRAW] else LOSS
+
+        taken = boards[0] | boards[1]
+        moves = ([], [], [])
+        for n in range(9):
+            bit = 1 << n
+            if taken & bit:
+                continue
+
+            board = boards[player] | bit
+            if any(board & mask == mask for mask in MASKS_BY_POSITION[n]):
+                result = WIN
+            elif taken | bit == FULL_BOARD:
+                result = DRAW
+            else:
+                child = [boards[0], boards[1]]
+                child[player] = board
+                # The opponent's result, flipped.
+                result = 2 - solve(child, 1 - player)
 
-        try:
-            next(self._valid_moves_iter())
-        except StopIteration:
-            return Players.UNSET
-        else:
-            return None
+            moves[result].append(n)
+
+        table[key] = tuple(tuple(m) for m in moves)
+        return WIN if moves[WIN] else DRAW if moves[DRAW] else LOSS
+
+    solve([0, 0], Players.X)
+    return table
+
+
+# Computed once, when the cog is loaded (~4.5k states, well under a second).
+SOLVED = _solve()
+
+# Chance of playing a random move instead of the best one.
+DIFFICULTIES = {'easy': 0.6, 'medium': 0.25, 'hard': 0}
+
+
+def choose_move(game, difficulty='hard'):
+    """Returns the bot's move (0-based) for the current state."""
+    moves = SOLVED[game.key]
+    if random.random() < DIFFICULTIES[difficulty]:
+        return random.choice(moves[WIN] + moves[DRAW] + moves[LOSS])
+
+    return random.choice(moves[WIN] or moves[DRAW] or moves[LOSS])
 
 
 # Integration #
 CUSTOM_ID_PREFIX = 'btn_'
 
+EMPTY_LABEL = '\u200b' + ' ' * 7 + '\u200b'
+EMOJIS = {Players.X: {'id': '863602074285375520'}, Players.O: {'id': '863602074545553418'}}
+ALLOWED_MENTIONS = {'parse': ['users']}
+
+
+def _build_button(n, value, disabled):
+    button = {'type': 2, 'custom_id': CUSTOM_ID_PREFIX + str(n + 1), 'disabled': disabled}
+    if value == Players.UNSET:
+        button['style'] = 2
+        button['label'] = EMPTY_LABEL
+    else:
+        button['style'] = 1
+        button['emoji'] = EMOJIS[value]
+    return button
+
+
+# BUTTONS[disabled][position][value], built once and shared by every
+# payload (they're never mutated).
+BUTTONS = tuple(
+    tuple(tuple(_build_button(n, value, disabled) for value in Players) for n in range(9))
+    for disabled in (False, True)
+)
+
+
+@lru_cache(maxsize=None)
+def get_components(key, disabled):
+    """The action rows for a board (by TTTImplementation.key)."""
+    buttons = BUTTONS[disabled]
+    x_board = key & FULL_BOARD
+    o_board = key >> 9
+
+    rows = []
+    for column in range(3):
+        row = []
+        for n in range(3 * column, 3 * column + 3):
+            bit = 1 << n
+            value = Players.X if x_board & bit else Players.O if o_board & bit else Players.UNSET
+            row.append(buttons[n][value])
+        rows.append({'type': 1, 'components': tuple(row)})
+    return tuple(rows)
+
+
+class BoardIntegration:
+    """
+    Runs turn based board games on a message with components.
+
+    Subclasses create the game and its components, the game must have
+    `turn`, `winner` (None while playing, Players.UNSET on a tie) and
+    `make_move`.
+    """
+
+    # Seconds a member has to play.
+    timeout = 120
 
-class TTTIntegration:
     def __init__(self, bot):
         self.bot = bot
         self.games: dict[int, GameInfo] = {}
-        self.__tasks = []
+        # game -> the Listener waiting for its next move.
+        self.__listeners = {}
+        # Only while handling a click or a timeout.
+        self.__tasks = set()
 
     def __contains__(self, value):
         return value in self.games
 
     def destroy(self):
-        for task in self.tasks:
+        for listener in self.__listeners.values():
+            listener.cancel()
+        for task in self.__tasks:
             task.cancel()
+        self.__listeners = {}
         self.games = {}
 
+    # TO IMPLEMENT
+
+    def new_game(self):
+        raise NotImplementedError
+
+    def get_components(self, info, disabled):
+        raise NotImplementedError
+
+    def get_content(self, info, txt):
+        return txt
+
+    async def get_move(self, info, custom_id, values):
+        """The move for a click, or None to wait for another one."""
+        try:
+            return int(custom_id[len(CUSTOM_ID_PREFIX) :]) - 1
+        except ValueError:
+            return None
+
+    def choose_move(self, info):
+        """The move of a bot player."""
+        raise NotImplementedError
+
     # HELPERS
 
     def _create_task(self, coro):
         task = self.bot.loop.create_task(coro)
-        self.__tasks.append(task)
-        task.add_done_callback(lambda f: self.__tasks.remove(task))
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
 
     async def _do_rollover(self, message):
+        activity = self.bot.channel_activity
         channel = message.channel
-        if channel.last_message == message:
-            return message
 
-        history = await channel.history(limit=6, after=message).flatten()
-        if len(history) > 5:
+        count = activity.messages_after(message)
+        if count is None:
+            # Not tracked yet, or we reconnected and may have lost messages.
+            history = await channel.history(limit=6, after=message).flatten()
+            count = len(history)
+            activity.track(message, count)
+
+        if count > 5:
+            activity.untrack(message)
             try:
                 await message.delete()
             except discord.HTTPException:
                 pass
-            return await channel.send('\N{ZERO WIDTH SPACE}')
+            message = await channel.send('\N{ZERO WIDTH SPACE}')
+            activity.track(message)
         return message
 
-    async def edit_message(self, msg, txt, game, force_disabled=False):
+    async def edit_message(self, info, txt, force_disabled=False):
+        msg = info.message
         route = discord.http.Route(
             'PATCH',
             '/channels/{channel_id}/messages/{message_id}',
@@ -140,82 +309,121 @@ class TTTIntegration:
             message_id=msg.id,
         )
 
-        payload = {'content': txt, 'allowed_mentions': {'parse': ['users']}}
-        payload['components'] = []
-
-        disabled = game.winner is not None or force_disabled
-
-        for column, rows in enumerate(game.table):
-            btn_row = []
-            for row, value in enumerate(rows):
-                base = {
-                    'type': 2,
-                    'custom_id': CUSTOM_ID_PREFIX + str((3 * column + 1) + row),
-                    'disabled': disabled,
-                }
-                if value == Players.UNSET:
-                    base['style'] = 2
-                    base['label'] = '\u200b' + ' ' * 7 + '\u200b'
-                elif value == Players.X:
-                    base['style'] = 1
-                    base['emoji'] = {'id': '863602074285375520'}
-                elif value == Players.O:
-                    base['style'] = 1
-                    base['emoji'] = {'id': '863602074545553418'}
-                btn_row.append(base)
-            payload['components'].append({'type': 1, 'components': btn_row})
+        disabled = info.game.winner is not None or force_disabled
+
+        payload = {
+            'content': self.get_content(info, txt),
+            'allowed_mentions': ALLOWED_MENTIONS,
+            'components': self.get_components(info, disabled),
+        }
 
         await self.bot.http.request(route, json=payload)
 
     # GAME
 
-    async def start(self, message, player_x, player_o):
-        game = TTTImplementation()
+    async def start(self, message, player_x, player_o, **options):
+        """Starts a game, `options` are passed to new_game."""
+        game = self.new_game(**options)
 
-        info = GameInfo(message, game, (player_x, player_o))
-        self.games[player_x.id] = info
-        self.games[player_o.id] = info
+        info = GameInfo(message, game, (player_x, player_o), options.get('difficulty'))
+        for player in info.players:
+            # Bots can be in any number of games.
+            if not player.bot:
+                self.games[player.id] = info
 
-        self._create_task(self._internal_loop(*info))
-        await self._update_game(*info)
+        # Otherwise the first rollover checks the history.
+        if getattr(message.channel, 'last_message_id', None) == message.id:
+            self.bot.channel_activity.track(message)
 
-    async def _internal_loop(self, _, game, players):
+        await self._play(info)
+
+    async def _play(self, info):
+        """Updates the message and plays until it's a member's turn."""
+        game = info.game
         try:
-            bot = self.bot
-            while game.winner is None:
-                # We need to dinamically access message, so rollover
-                # works.
-                message = self.games[players[0].id][0]
-
-                player = players[game.turn]
-                move = await wait_for_click(self.bot, message.id, player.id, timeout=120)
-
-                try:
-                    game.make_move(int(move[len(CUSTOM_ID_PREFIX) :]) - 1)
-                except ValueError:
-                    continue
-
-                await self._update_game(message, game, players)
-        except asyncio.TimeoutError:
-            message = self.games[players[0].id][0]
-            return await self.edit_message(message, 'Tempo excedido', game, True)
-        finally:
-            del self.games[players[0].id], self.games[players[1].id]
-
-    async def _update_game(self, message, game, players):
+            info = await self._update_game(info)
+            while game.winner is None and info.players[game.turn].bot:
+                game.make_move(self.choose_move(info))
+                info = await self._update_game(info)
+        except Exception:
+            self._end(info)
+            raise
+
+        if game.winner is None:
+            self._wait_for_move(info)
+        else:
+            self._end(info)
+
+    def _wait_for_move(self, info):
+        # No task is kept while waiting, only the listener.
+        self.__listeners[info.game] = self.bot.interactions.listen(
+            info.message.id,
+            info.players[info.game.turn].id,
+            lambda *click: self._create_task(self._on_click(info, *click)),
+            timeout=self.timeout,
+            on_timeout=lambda: self._create_task(self._on_timeout(info)),
+        )
+
+    async def _on_click(self, info, custom_id, *values):
+        try:
+            move = await self.get_move(info, custom_id, values)
+        except Exception:
+            self._end(info)
+            raise
+
+        if move is not None:
+            try:
+                info.game.make_move(move)
+            except ValueError:
+                move = None
+
+        if move is None:
+            return self._wait_for_move(info)
+
+        await self._play(info)
+
+    async def _on_timeout(self, info):
+        self._end(info)
+        await self.edit_message(info, 'Tempo excedido', True)
+
+    def _end(self, info):
+        self.__listeners.pop(info.game, None)
+        self.bot.channel_activity.untrack(info.message)
+        for player in info.players:
+            self.games.pop(player.id, None)
+
+    def get_status(self, info):
+        game, players = info.game, info.players
+
         winner = game.winner
         if winner is None:
-            txt = _('Vez de {player}.', player=players[game.turn].mention)
-        else:
-            if winner == Players.UNSET:
-                txt = _('Deu velha!')
-            else:
-                txt = _('{player} ganhou!', player=players[winner].mention)
+            return _('Vez de {player}.', player=players[game.turn].mention)
+        if winner == Players.UNSET:
+            return _('Deu velha!')
+        return _('{player} ganhou!', player=players[winner].mention)
+
+    async def _update_game(self, info):
+        txt = self.get_status(info)
+        players = info.players
 
-        msg = await self._do_rollover(message)
+        msg = await self._do_rollover(info.message)
 
-        if msg != message and game.winner is None:
+        if msg != info.message:
+            info = info._replace(message=msg)
             for player in players:
-                self.games[player.id] = (msg, game, players)
+                if not player.bot:
+                    self.games[player.id] = info
+
+        await self.edit_message(info, txt)
+        return info
+
+
+class TTTIntegration(BoardIntegration):
+    def new_game(self, *, difficulty='hard'):
+        return TTTImplementation()
+
+    def get_components(self, info, disabled):
+        return get_components(info.game.key, disabled)
 
-        await self.edit_message(msg, txt, game)
+    def choose_move(self, info):
+        return choose_move(info.game, info.difficulty)
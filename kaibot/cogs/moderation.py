@@ -252,14 +252,7 @@ class Moderation(custom.Cog, translator=_):
     @commands.group(invoke_without_command=True)
     async def prefix(self, ctx):
         """Comandos relacionados ao prefixo do servidor."""
-        prefixes = (f'@{self.bot.user.name}',)
-
-        doc = await self.bot.db.guilds.find(ctx.guild.id)
-        if not doc or not doc.prefixes:
-            prefixes += config.PREFIXES
-        else:
-            prefixes += tuple(doc.prefixes)
-
+        prefixes = (f'@{self.bot.user.name}',) + ctx.guild_config.prefixes
         prefixes = (f'`{prefix}`' for prefix in prefixes)
 
         await ctx.send(_('Os prefixos do servidor são: {prefixes}', prefixes=format_list(prefixes)))
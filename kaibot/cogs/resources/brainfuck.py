@@ -1,66 +1,469 @@
 import io
-from collections import defaultdict
-from concurrent.futures import CancelledError
+import time
+from bisect import bisect_left
+from typing import NamedTuple
+
+# Opcodes #
+
+ADD = 0  # cell += arg
+MOVE = 1  # ptr += arg
+JUMP_IF_ZERO = 2  # to arg, the matching JUMP_IF_NOT_ZERO
+JUMP_IF_NOT_ZERO = 3  # to arg, the matching JUMP_IF_ZERO
+CLEAR = 4  # [-] (arg -1) and [+] (arg 1)
+SCAN = 5  # [>] and [<], moves arg cells until a zero
+MULTIPLY = 6  # [->++>+<<], arg is (step, ((offset, factor), ...), lowest, highest)
+OUTPUT = 7
+INPUT = 8
+
+# Cells added at once when the pointer leaves the tape.
+TAPE_GROWTH = 256
+
+
+class Program(NamedTuple):
+    ops: list
+    args: list
+
+
+class Result(NamedTuple):
+    output: str
+    memory: dict
+    instructions: int
+
+
+class BrainfuckError(Exception):
+    pass
+
+
+class InfiniteLoop(BrainfuckError):
+    """The program reached a loop that never ends."""
+
+
+class InstructionLimit(BrainfuckError):
+    """The program ran more instructions than allowed."""
+
+
+class TapeLimit(BrainfuckError):
+    """The program used more cells than allowed."""
+
+
+def _fold_loop(ops, args):
+    """The (op, arg) that replaces a loop with this body, if any."""
+    if ops == [MOVE]:
+        return SCAN, args[0]
+
+    if not ops or any(op not in (ADD, MOVE) for op in ops):
+        return None
+
+    offset = 0
+    deltas = {}
+    for op, arg in zip(ops, args):
+        if op == MOVE:
+            offset += arg
+        else:
+            deltas[offset] = deltas.get(offset, 0) + arg
+
+    # The loop must end on the same cell, and count it down (or up) by 1.
+    step = deltas.pop(0, 0)
+    if offset or step not in (-1, 1):
+        return None
+
+    targets = tuple((offset, factor) for offset, factor in deltas.items() if factor)
+    if not targets:
+        return CLEAR, step
+
+    offsets = [offset for offset, _ in targets]
+    return MULTIPLY, (step, targets, min(offsets), max(offsets))
+
+
+def compile_brainfuck(code):
+    """
+    Compiles the code to a Program, folding runs of +-<>, the [-], [+],
+    [>] and [<] idioms and multiplication loops into single ops, with
+    the jumps resolved.
+
+    Like the old interpreter, a ] without [ is ignored and everything
+    after a [ without ] never runs.
+    """
+    ops = []
+    args = []
+    stack = []
+
+    for char in code:
+        if char in '+-':
+            delta = 1 if char == '+' else -1
+            if ops and ops[-1] == ADD:
+                args[-1] += delta
+                if not args[-1]:
+                    ops.pop()
+                    args.pop()
+            else:
+                ops.append(ADD)
+                args.append(delta)
+        elif char in '<>':
+            delta = 1 if char == '>' else -1
+            if ops and ops[-1] == MOVE:
+                args[-1] += delta
+                if not args[-1]:
+                    ops.pop()
+                    args.pop()
+            else:
+                ops.append(MOVE)
+                args.append(delta)
+        elif char == '.':
+            ops.append(OUTPUT)
+            args.append(0)
+        elif char == ',':
+            ops.append(INPUT)
+            args.append(0)
+        elif char == '[':
+            stack.append(len(ops))
+            ops.append(JUMP_IF_ZERO)
+            args.append(0)
+        elif char == ']':
+            if not stack:
+                continue
+
+            start = stack.pop()
+            folded = _fold_loop(ops[start + 1 :], args[start + 1 :])
+            if folded is not None:
+                del ops[start:], args[start:]
+                ops.append(folded[0])
+                args.append(folded[1])
+                continue
+
+            args[start] = len(ops)
+            ops.append(JUMP_IF_NOT_ZERO)
+            args.append(start)
+
+    if stack:
+        del ops[stack[0] :], args[stack[0] :]
+
+    return Program(ops, args)
 
 
 class BrainfuckDecoder:
-    def __init__(self, input_):
-        self.input = io.StringIO(input_ + '\x00')
-        self.mem = defaultdict(int)
+    """
+    Runs compiled programs on a tape of unbounded ints, which grows in
+    both directions as needed.
+
+    `instructions` counts the executed ops (a folded op counts as one).
+    """
+
+    def __init__(self, input_, *, max_instructions=None, max_cells=None):
+        self.input = input_
+        self.input_position = 0
+        self.tape = [0] * TAPE_GROWTH
+        # The index of the cell 0 in the tape, it moves when the tape
+        # grows to the left.
+        self.origin = 0
         self.ptr = 0
-        self.cancelled = False
-
-    def _raise_if_cancelled(self):
-        if self.cancelled:
-            raise CancelledError()
-
-    def _parse(self, code, output):
-        while_code = None
-        enclosure_count = 0
-
-        for char in code:
-            self._raise_if_cancelled()
-            if char == ']' and while_code is not None and enclosure_count == 0:
-                code = while_code
-                while_code = None
-                while self.mem[self.ptr]:
-                    self._parse(code, output)
-
-            elif while_code is not None:
-                if char == '[':
-                    enclosure_count += 1
-                elif char == ']':
-                    enclosure_count -= 1
-                while_code += char
-            elif char == '>':
-                self.ptr += 1
-            elif char == '<':
-                self.ptr -= 1
-            elif char == '+':
-                self.mem[self.ptr] += 1
-            elif char == '-':
-                self.mem[self.ptr] -= 1
-            elif char == '.':
-                try:
-                    output.write(chr(self.mem[self.ptr]))
-                except ValueError:
-                    # Not in range
-                    output.write('\N{REPLACEMENT CHARACTER}')
-            elif char == ',':
-                _tmp = ord(self.input.read(1))
-                if _tmp == 0:
-                    self.input.seek(0)
-                    _tmp = ord(self.input.read(1))
-                self.mem[self.ptr] = _tmp if _tmp else -1
-            elif char == '[':
-                while_code = ''
+        self.instructions = 0
+        self.max_instructions = max_instructions
+        self.max_cells = max_cells
 
-    def __call__(self, code):
-        output = io.StringIO()
+    @property
+    def mem(self):
+        """The non-zero cells, by their position."""
+        origin = self.origin
+        return {index - origin: value for index, value in enumerate(self.tape) if value}
+
+    def _read_input(self):
+        if not self.input:
+            return -1
+        char = self.input[self.input_position % len(self.input)]
+        self.input_position += 1
+        return ord(char)
+
+    def _grow(self, lowest, highest):
+        """
+        Grows the tape to include the indexes between lowest and highest,
+        returns lowest in the new tape.
+        """
+        tape = self.tape
+        size = len(tape) + max(highest - len(tape) + 1, 0) + max(-lowest, 0)
+        if self.max_cells is not None and size > self.max_cells:
+            raise TapeLimit()
+
+        if highest >= len(tape):
+            tape.extend([0] * (highest - len(tape) + TAPE_GROWTH))
+        if lowest < 0:
+            grow = TAPE_GROWTH - lowest
+            tape[:0] = [0] * grow
+            lowest += grow
+            self.origin += grow
+        return lowest
+
+    def run(self, program, output):
+        ops, args = program
+        tape = self.tape
+        ptr = self.ptr
+        pc = 0
+        end = len(ops)
+        # The ops between jumps always run in sequence, so they're only
+        # counted when jumping.
+        block_start = 0
+        instructions = self.instructions
+        max_instructions = self.max_instructions
+        if max_instructions is None:
+            max_instructions = float('inf')
 
         try:
-            self._parse(code, output)
-        except CancelledError:
-            return
+            while pc < end:
+                op = ops[pc]
+                if op == ADD:
+                    tape[ptr] += args[pc]
+                elif op == MOVE:
+                    ptr += args[pc]
+                    if not 0 <= ptr < len(tape):
+                        ptr = self._grow(ptr, ptr)
+                elif op == JUMP_IF_NOT_ZERO:
+                    if tape[ptr]:
+                        instructions += pc - block_start + 1
+                        block_start = pc + 1
+                        if instructions > max_instructions:
+                            raise InstructionLimit()
+                        pc = args[pc]
+                        block_start = pc + 1
+                elif op == JUMP_IF_ZERO:
+                    if not tape[ptr]:
+                        instructions += pc - block_start + 1
+                        pc = args[pc]
+                        block_start = pc + 1
+                elif op == CLEAR:
+                    value = tape[ptr]
+                    # [-] on a negative cell (or [+] on a positive one)
+                    # never reaches zero.
+                    if value * args[pc] > 0:
+                        raise InfiniteLoop()
+                    tape[ptr] = 0
+                elif op == SCAN:
+                    step = args[pc]
+                    while tape[ptr]:
+                        ptr += step
+                        if not 0 <= ptr < len(tape):
+                            ptr = self._grow(ptr, ptr)
+                elif op == MULTIPLY:
+                    value = tape[ptr]
+                    if value:
+                        step, targets, lowest, highest = args[pc]
+                        if value * step > 0:
+                            raise InfiniteLoop()
+                        if ptr + lowest < 0 or ptr + highest >= len(tape):
+                            ptr = self._grow(ptr + lowest, ptr + highest) - lowest
+                        times = -value * step
+                        for offset, factor in targets:
+                            tape[ptr + offset] += factor * times
+                        tape[ptr] = 0
+                elif op == OUTPUT:
+                    try:
+                        output.write(chr(tape[ptr]))
+                    except (ValueError, OverflowError):
+                        # Not in range
+                        output.write('\N{REPLACEMENT CHARACTER}')
+                elif op == INPUT:
+                    tape[ptr] = self._read_input()
+                pc += 1
+        finally:
+            self.ptr = ptr
+            self.instructions = instructions + min(pc + 1, end) - block_start
 
+    def __call__(self, code):
+        output = io.StringIO()
+        self.run(compile_brainfuck(code), output)
         return output.getvalue()
+
+
+def run_brainfuck(code, input_, max_instructions=None, max_cells=None):
+    """Runs the code, made to be sent to a sandbox worker."""
+    decoder = BrainfuckDecoder(input_, max_instructions=max_instructions, max_cells=max_cells)
+    output = decoder(code)
+    return Result(output, decoder.mem, decoder.instructions)
+
+
+# Encoder #
+
+# The most cells set up before printing, besides the loop counters.
+MAX_ENCODER_CELLS = 8
+
+
+def _bounds(centers):
+    """The midpoints of the sorted centers, bisect them to find the nearest one."""
+    return [(a + b) / 2 for a, b in zip(centers, centers[1:])]
+
+
+def _clusters(counts, k):
+    """Splits the codes into k groups (1D k-means), returns their centers."""
+    codes = sorted(counts)
+    k = min(k, len(codes))
+    # Start with the quantiles.
+    centers = [codes[(2 * i + 1) * len(codes) // (2 * k)] for i in range(k)]
+
+    for _ in range(8):
+        bounds = _bounds(centers)
+        groups = [[] for _ in centers]
+        for code in codes:
+            groups[bisect_left(bounds, code)].append(code)
+
+        new_centers = [
+            round(sum(code * counts[code] for code in group) / sum(counts[code] for code in group))
+            for group in groups
+            if group
+        ]
+        if new_centers == centers:
+            break
+        centers = new_centers
+        k = len(centers)
+
+    return sorted(centers)
+
+
+def _setup_code(counters, multipliers):
+    """
+    The code that sets the cell after the counters to the product of the
+    counters times each multiplier, ending on the first counter.
+    """
+    targets = ''.join('>' + '+' * m for m in multipliers) + '<' * len(multipliers)
+    if not counters:
+        return targets
+
+    code = '+' * counters[-1] + '[' + targets + '-]'
+    for counter in reversed(counters[:-1]):
+        code = '+' * counter + '[>' + code + '<-]'
+    return code
+
+
+def _print_cost(codes, cells, pos):
+    """The length of the code printing codes from this tape, picking the closest cells."""
+    cells = list(cells)
+    indexes = range(len(cells))
+    cost = 0
+    for code in codes:
+        best = pos
+        best_cost = abs(cells[pos] - code)
+        for i in indexes:
+            cell_cost = abs(pos - i) + abs(cells[i] - code)
+            if cell_cost < best_cost:
+                best = i
+                best_cost = cell_cost
+        cost += best_cost + 1
+        cells[best] = code
+        pos = best
+    return cost
+
+
+def _print_code(codes, cells, pos):
+    cells = list(cells)
+    indexes = range(len(cells))
+    parts = []
+    for code in codes:
+        best = pos
+        best_cost = abs(cells[pos] - code)
+        for i in indexes:
+            cell_cost = abs(pos - i) + abs(cells[i] - code)
+            if cell_cost < best_cost:
+                best = i
+                best_cost = cell_cost
+
+        moves = best - pos
+        parts.append('>' * moves if moves > 0 else '<' * -moves)
+        delta = code - cells[best]
+        parts.append('+' * delta if delta > 0 else '-' * -delta)
+        parts.append('.')
+        cells[best] = code
+        pos = best
+    return ''.join(parts)
+
+
+def _counter_options():
+    """Loop counters by their product, nested when it's cheaper."""
+    options = {n: (n,) for n in range(1, 65)}
+    for a in range(2, 49):
+        for b in range(a, 49):
+            product = a * b
+            if a + b + 4 < sum(options.get(product, (product,))):
+                options[product] = (a, b)
+    return tuple(options.items())
+
+
+COUNTER_OPTIONS = _counter_options()
+
+
+def _layouts(codes, counts, deadline, timer):
+    """
+    Yields (counters, multipliers), ranked by an estimate of the code:
+    the setup, how far each cell starts from its group and how much
+    printing moves between and inside the groups.
+
+    Only the numbers of cells ranked before the deadline are yielded.
+    """
+    candidates = []
+    for k in range(1, min(MAX_ENCODER_CELLS, len(counts)) + 1):
+        if timer() > deadline:
+            break
+
+        centers = _clusters(counts, k)
+        bounds = _bounds(centers)
+        group = {code: bisect_left(bounds, code) for code in counts}
+        printing = sum(abs(code - centers[group[code]]) * count for code, count in counts.items())
+        printing += sum(abs(group[a] - group[b]) for a, b in zip(codes, codes[1:]))
+
+        for product, counters in COUNTER_OPTIONS:
+            multipliers = [round(center / product) for center in centers]
+            estimate = printing + sum(counters) + sum(multipliers) + 2 * k
+            estimate += sum(abs(c - product * m) for c, m in zip(centers, multipliers))
+            candidates.append((estimate, counters, multipliers))
+
+    candidates.sort(key=lambda candidate: candidate[0])
+    for _, counters, multipliers in candidates:
+        yield counters, multipliers
+
+
+def encode_brainfuck(text, *, budget=0.1, timer=time.thread_time):
+    """
+    Generates a program that prints text, searching cell layouts set up
+    by multiplication loops for the shortest one until `budget` seconds
+    of CPU time are spent.
+    """
+    if not text:
+        return ''
+
+    deadline = timer() + budget
+    codes = [ord(char) for char in text]
+    counts = {}
+    for code in codes:
+        counts[code] = counts.get(code, 0) + 1
+
+    # Only +, so there's always a result.
+    best = ((), [])
+    start = timer()
+    best_cost = _print_cost(codes, [0], 0)
+    # Generating the code takes about as long as costing a layout, so
+    # the slowest costing is kept out of the search.
+    reserve = timer() - start
+
+    for counters, multipliers in _layouts(codes, counts, deadline - reserve, timer):
+        setup_cost = len(_setup_code(counters, multipliers))
+        if setup_cost < best_cost:
+            product = 1
+            for counter in counters:
+                product *= counter
+            cells = [0] * len(counters) + [product * m for m in multipliers]
+
+            start = timer()
+            cost = setup_cost + _print_cost(codes, cells, 0)
+            reserve = max(reserve, timer() - start)
+            if cost < best_cost:
+                best = (counters, multipliers)
+                best_cost = cost
+
+        if timer() + reserve > deadline:
+            break
+
+    counters, multipliers = best
+    product = 1
+    for counter in counters:
+        product *= counter
+    cells = [0] * len(counters) + [product * m for m in multipliers]
+    if not cells:
+        cells = [0]
+    return _setup_code(counters, multipliers) + _print_code(codes, cells, 0)
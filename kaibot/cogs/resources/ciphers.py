@@ -0,0 +1,115 @@
+"""Table driven ciphers, every table is built once."""
+import base64
+import json
+import string
+from functools import lru_cache
+from pathlib import Path
+
+
+def _load_jsonc(path):
+    with open(path, encoding='utf-8') as f:
+        lines = [line for line in f if not line.lstrip().startswith('//')]
+    return json.loads(''.join(lines))
+
+
+# MORSE #
+
+MORSE_ENCODE = _load_jsonc(Path(__file__).with_name('morse.jsonc'))
+# For codes with more than one character, the last one wins (see the table).
+MORSE_DECODE = {code: char for char, code in MORSE_ENCODE.items()}
+
+
+def encode_morse(text):
+    """Letters are separated by spaces and words by /, unknown characters are dropped."""
+    words = (' '.join(filter(None, map(MORSE_ENCODE.get, word))) for word in text.upper().split())
+    return ' / '.join(filter(None, words))
+
+
+def decode_morse(code):
+    words = (''.join(filter(None, map(MORSE_DECODE.get, word.split()))) for word in code.split('/'))
+    return ' '.join(filter(None, words))
+
+
+# CAESAR #
+
+_LETTERS = string.ascii_lowercase + string.ascii_uppercase
+
+
+@lru_cache(maxsize=26)
+def _caesar_table(shift):
+    shift %= 26
+    lower = string.ascii_lowercase[shift:] + string.ascii_lowercase[:shift]
+    upper = string.ascii_uppercase[shift:] + string.ascii_uppercase[:shift]
+    return str.maketrans(_LETTERS, lower + upper)
+
+
+def caesar(text, shift):
+    """Shifts the ASCII letters, use a negative shift to decrypt."""
+    return text.translate(_caesar_table(shift))
+
+
+# VIGENÈRE #
+
+
+def vigenere(text, key, *, decrypt=False):
+    """
+    Shifts each ASCII letter by the next letter of the key, the other
+    characters don't use the key.
+    """
+    shifts = [string.ascii_lowercase.index(c) for c in key.lower() if c in string.ascii_lowercase]
+    if not shifts:
+        raise ValueError('The key must have at least one letter.')
+    if decrypt:
+        shifts = [-shift for shift in shifts]
+
+    positions = [i for i, char in enumerate(text) if char in _LETTERS]
+    letters = ''.join(text[i] for i in positions)
+
+    # Every len(key)-th letter uses the same shift, so each slice is one
+    # translate.
+    shifted = list(letters)
+    for offset, shift in enumerate(shifts):
+        shifted[offset :: len(shifts)] = letters[offset :: len(shifts)].translate(
+            _caesar_table(shift)
+        )
+
+    result = list(text)
+    for i, char in zip(positions, shifted):
+        result[i] = char
+    return ''.join(result)
+
+
+# BASE-N #
+
+# Bytes as fixed width numbers, separated by spaces.
+_BYTE_DIGITS = {
+    2: tuple(format(byte, '08b') for byte in range(256)),
+    8: tuple(format(byte, '03o') for byte in range(256)),
+    10: tuple(format(byte, '03d') for byte in range(256)),
+}
+
+_BASE64_CODECS = {
+    16: (base64.b16encode, lambda data: base64.b16decode(data, casefold=True)),
+    32: (base64.b32encode, lambda data: base64.b32decode(data, casefold=True)),
+    64: (base64.b64encode, lambda data: base64.b64decode(data, validate=True)),
+    85: (base64.b85encode, base64.b85decode),
+}
+
+BASES = tuple(sorted((*_BYTE_DIGITS, *_BASE64_CODECS)))
+
+
+def encode_base(text, base):
+    data = text.encode('utf-8')
+    if base in _BYTE_DIGITS:
+        return ' '.join(map(_BYTE_DIGITS[base].__getitem__, data))
+    return _BASE64_CODECS[base][0](data).decode('ascii')
+
+
+def decode_base(code, base):
+    """Raises ValueError if the code is invalid."""
+    if base in _BYTE_DIGITS:
+        data = bytes(int(token, base) for token in code.split())
+    else:
+        # binascii.Error is a ValueError.
+        data = _BASE64_CODECS[base][1](''.join(code.split()).encode('ascii'))
+    return data.decode('utf-8', errors='replace')
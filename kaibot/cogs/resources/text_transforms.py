@@ -0,0 +1,52 @@
+import random
+
+# Tables #
+
+# FF01 is the start of vaporwave "font". $ (36) onwards, like it always was.
+VAPORWAVE = str.maketrans({chr(c): chr(c - 33 + 0xFF01) for c in range(36, 127)})
+
+# All the printable ASCII, including the space.
+FULLWIDTH = str.maketrans({' ': '　', **{chr(c): chr(c - 33 + 0xFF01) for c in range(33, 127)}})
+
+SMALL_CAPS = str.maketrans('abcdefghijklmnopqrstuvwxyz', 'ᴀʙᴄᴅᴇꜰɢʜɪᴊᴋʟᴍɴᴏᴘǫʀsᴛᴜᴠᴡxʏᴢ')
+
+# Applied before reversing the text.
+UPSIDE_DOWN = str.maketrans(
+    {
+        **dict(zip('abcdefghijklmnopqrstuvwxyz', 'ɐqɔpǝɟƃɥᴉɾʞlɯuodbɹsʇnʌʍxʎz')),
+        **dict(zip('ABCDEFGHIJKLMNOPQRSTUVWXYZ', '∀ꓭƆꓷƎℲ⅁HIſꓘ⅂WNOԀΌꓤS⊥∩ΛMX⅄Z')),
+        **dict(zip('0123456789', '0ƖᄅƐㄣϛ9ㄥ86')),
+        **dict(zip('.,!?\'"&_;()[]{}<>', "˙'¡¿,„⅋‾؛)(][}{><")),
+    }
+)
+
+# Combining marks, drawn above, through and below the letters.
+ZALGO_MARKS = (
+    ''.join(map(chr, range(0x0300, 0x0315)))
+    + ''.join(map(chr, range(0x0334, 0x0339)))
+    + ''.join(map(chr, range(0x0316, 0x0334)))
+)
+
+# Transforms #
+
+
+def vaporwave(text):
+    return text.translate(VAPORWAVE)
+
+
+def fullwidth(text):
+    return text.translate(FULLWIDTH)
+
+
+def small_caps(text):
+    return text.lower().translate(SMALL_CAPS)
+
+
+def upside_down(text):
+    return text.translate(UPSIDE_DOWN)[::-1]
+
+
+def zalgo(text, marks=3, *, rng=random):
+    """Adds `marks` random combining marks after each character."""
+    columns = [rng.choices(ZALGO_MARKS, k=len(text)) for _ in range(marks)]
+    return ''.join(map(''.join, zip(text, *columns)))
@@ -1,19 +1,32 @@
+import io
 import re
 import json
 import sys
 import asyncio
 from random import randint
-from functools import cached_property
+from string import ascii_letters
+from typing import Optional
+from functools import partial
 
 import discord
 from discord.ext import commands
-from aiohttp import ClientConnectorError, TooManyRedirects
+from aiohttp import ClientConnectorError
 
 from .. import config
 from ..i18n import Translator
 from ..utils import custom, format_list
 from ..utils.decorators import in_executor
-from .resources.brainfuck import BrainfuckDecoder
+from ..utils.database import MISSING, LRUCache
+from ..utils.resolver import RedirectResolver, TooManyRedirects
+from ..utils.sandbox import ProcessSandbox, SandboxError
+from .resources import ciphers, text_transforms
+from .resources.brainfuck import (
+    InfiniteLoop,
+    InstructionLimit,
+    TapeLimit,
+    encode_brainfuck,
+    run_brainfuck,
+)
 
 _ = Translator(__name__)
 
@@ -24,9 +37,23 @@ class Utilities(custom.Cog, translator=_):
     DICE_REGEX = re.compile(r'((?P<count>\d*)d)?(?P<sides>\d+(?!\d*d))')  # Regex Sucks
     # Includes: 0-9 a-z A-Z
     BF_INPUT = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+    # Biggest file accepted by the ciphers.
+    MAX_INPUT_SIZE = 1024 * 1024
 
     def __init__(self, bot):
         self.bot = bot
+        self.bf_sandbox = ProcessSandbox(config.BF_WORKERS, memory_limit=config.BF_MEMORY_LIMIT)
+        # text -> code, for k.brainfuck encode.
+        self.bf_encode_cache = LRUCache(256)
+        self.resolver = RedirectResolver(
+            bot.session,
+            per_host=config.RESOLVE_PER_HOST,
+            timeout=config.RESOLVE_TIMEOUT,
+            cache_ttl=config.RESOLVE_CACHE_TTL,
+        )
+
+    def cog_unload(self):
+        self.bf_sandbox.close()
 
     @commands.command()
     async def roll(self, ctx, dice='d20'):
@@ -75,50 +102,60 @@ class Utilities(custom.Cog, translator=_):
         if not link.strip('<>').startswith(('http://', 'https://')):
             link = 'http://' + link
 
-        # FIXME: Really. Fix this mess.
-        description = ''
         async with ctx.typing():
             try:
-                dest = await self.bot.session.get(link.strip('<>'), max_redirects=30)
+                hops = await self.resolver.resolve(link.strip('<>'))
             except ClientConnectorError as e:
                 return await ctx.send(
                     _('Não pude me conectar com o site: `{error}`', error=e.strerror)
                 )
             except TooManyRedirects:
                 return await ctx.send(_('O site redirecionou muitas vezes.'))
+            except asyncio.TimeoutError:
+                return await ctx.send(_('O site demorou demais para responder.'))
 
-            h_len = len(dest.history)
-            for index, res in enumerate(dest.history + (dest,)):
-                em = '🔷' if index in (0, h_len) else '🔹'
-                description += f'{em} `{res.status}` - {res.url}\n'
+        description = ''
+        for index, hop in enumerate(hops):
+            em = '🔷' if index in (0, len(hops) - 1) else '🔹'
+            description += f'{em} `{hop.status}` - {hop.url}\n'
 
         embed.description = description
 
         return await ctx.send(embed=embed)
 
-    @in_executor
-    def _convert_to_vaporwave(self, text):
-        output = ''
-        for char in text:
-            if 36 <= ord(char) <= 126:
-                # FF01 is the start of vaporwave "font".
-                output += chr(ord(char) - 33 + 0xFF01)
-            else:
-                output += char
-        return output
+    async def _send_transformed(self, ctx, text, transform, *, expansion=1):
+        """Sends the transformed text, `expansion` is how many times longer it gets."""
+        author_notes = f'\n\n> {_("Texto por: {author}", author=ctx.author.mention)}'
+        max_len = (2000 - len(author_notes)) // expansion
+        if len(text) > max_len:
+            return await ctx.send(_('O texto pode ter no máximo {max} caracteres.', max=max_len))
+
+        await ctx.send(transform(text) + author_notes)
 
     @commands.command()
     async def vaporwave(self, ctx, *, text):
         """Transforma o texto em ｖａｐｏｒｗａｖｅ."""
-        author_notes = f'\n\n> {_("Texto por: {author}", author=ctx.author.mention)}'
-        max_len = 2000 - len(author_notes)
-        if len(text) > max_len:
-            return await ctx.send(_('O texto pode ter no máximo {max} caracteres.', max=max_len))
+        await self._send_transformed(ctx, text, text_transforms.vaporwave)
 
-        async with ctx.typing():
-            converted = await self._convert_to_vaporwave(text)
+    @commands.command(aliases=['largo'])
+    async def fullwidth(self, ctx, *, text):
+        """Transforma o texto em ｌａｒｇｕｒａ　ｃｈｅｉａ."""
+        await self._send_transformed(ctx, text, text_transforms.fullwidth)
+
+    @commands.command(aliases=['versalete'])
+    async def smallcaps(self, ctx, *, text):
+        """Transforma o texto em ᴠᴇʀsᴀʟᴇᴛᴇ."""
+        await self._send_transformed(ctx, text, text_transforms.small_caps)
+
+    @commands.command(aliases=['invertido'])
+    async def upsidedown(self, ctx, *, text):
+        """Vira o texto de ponta-cabeça."""
+        await self._send_transformed(ctx, text, text_transforms.upside_down)
 
-        await ctx.send(converted + author_notes)
+    @commands.command()
+    async def zalgo(self, ctx, *, text):
+        """Transforma o texto em z̷a̶l̸g̵o̴."""
+        await self._send_transformed(ctx, text, text_transforms.zalgo, expansion=4)
 
     @commands.group(invoke_without_command=True)
     async def brainfuck(self, ctx):
@@ -134,20 +171,34 @@ class Utilities(custom.Cog, translator=_):
         `,` lerá o próximo valor de uma string `A-Za-z0-9`.
         Por exemplo: `,.` imprimiria "A".
         """
-        decoder = BrainfuckDecoder(self.BF_INPUT)
-        runner = in_executor(decoder)
-
         try:
             async with ctx.typing():
-                out = await asyncio.wait_for(runner(text), timeout=30)
+                result = await self.bf_sandbox.run(
+                    run_brainfuck,
+                    text,
+                    self.BF_INPUT,
+                    config.BF_MAX_INSTRUCTIONS,
+                    config.BF_MAX_CELLS,
+                    timeout=config.BF_TIMEOUT,
+                )
         except asyncio.TimeoutError:
-            await ctx.send(_('Tempo excedido.'))
-
-            decoder.cancelled = True
-            await asyncio.sleep(0.3)  # Let decoder cancel
-            return decoder.mem.clear()
-
-        mem = json.dumps(decoder.mem, indent=2, check_circular=False).replace('"', '')
+            return await ctx.send(_('Tempo excedido.'))
+        except InfiniteLoop:
+            return await ctx.send(_('O programa nunca termina.'))
+        except InstructionLimit:
+            max_instructions = config.BF_MAX_INSTRUCTIONS
+            return await ctx.send(
+                _('O programa passou do limite de {max} instruções.', max=max_instructions)
+            )
+        except TapeLimit:
+            return await ctx.send(
+                _('O programa passou do limite de {max} células.', max=config.BF_MAX_CELLS)
+            )
+        except (SandboxError, MemoryError):
+            return await ctx.send(_('O programa usou memória demais.'))
+
+        out = result.output
+        mem = json.dumps(result.memory, indent=2, check_circular=False).replace('"', '')
 
         embed = discord.Embed(title='Brainfuck', color=config.MAIN_COLOR)
         embed.set_footer(
@@ -157,10 +208,32 @@ class Utilities(custom.Cog, translator=_):
         if out.strip():
             embed.add_field(name=_('Saída:'), value=out, inline=False)
         embed.add_field(name=_('Memória:'), value=f'```py\n{mem}```', inline=False)
+        embed.add_field(name=_('Instruções:'), value=str(result.instructions), inline=False)
 
         return await ctx.send(embed=embed)
 
-    # TODO: Brainfuck Encode?
+    @in_executor
+    def _encode_brainfuck(self, text):
+        return encode_brainfuck(text, budget=config.BF_ENCODE_BUDGET)
+
+    @brainfuck.command(name='encode')
+    async def brainfuck_encode(self, ctx, *, text):
+        """
+        Codificador de [brainfuck](https://pt.wikipedia.org/wiki/Brainfuck).
+
+        Gera um código que imprime o texto.
+        """
+        code = self.bf_encode_cache.get(text)
+        if code is MISSING:
+            async with ctx.typing():
+                code = await self._encode_brainfuck(text)
+            self.bf_encode_cache.insert(text, code)
+
+        content = f'```bf\n{code}```'
+        if len(content) > 2000:
+            file = discord.File(io.BytesIO(code.encode()), filename='brainfuck.bf')
+            return await ctx.send(file=file)
+        return await ctx.send(content)
 
     @commands.group(invoke_without_command=True)
     async def encrypt(self, ctx, criptography, text):
@@ -172,50 +245,106 @@ class Utilities(custom.Cog, translator=_):
         """Comandos para descriptografar um código."""
         await ctx.send_help(self.decrypt)
 
-    # MORSE #
+    # CIPHERS #
 
-    @cached_property
-    def morse_table(self):
-        with open('cogs/resources/morse.jsonc') as f:
-            to_parse = re.sub('//.+', '', f.read())
-            return json.loads(to_parse)
+    async def _read_input(self, ctx, text):
+        """The text, or the content of the attached file if there's one."""
+        if not ctx.message.attachments:
+            return text
 
-    @cached_property
-    def inverted_morse_table(self):
-        return dict(zip(self.morse_table.values(), self.morse_table.keys()))
+        attachment = ctx.message.attachments[0]
+        if attachment.size > self.MAX_INPUT_SIZE:
+            size = self.MAX_INPUT_SIZE // 1024
+            await ctx.send(_('O arquivo pode ter no máximo {size} KiB.', size=size))
+            return None
+        return (await attachment.read()).decode('utf-8', errors='replace')
 
-    @encrypt.command(name='morse')
-    async def encrypt_morse(self, ctx, *, text: str.split):
-        """Criptografar código morse."""
-        final = ''
-        for word in text:
-            for char in word:
-                try:
-                    final += self.morse_table[char.upper()] + ' '
-                except KeyError:
-                    pass
+    async def _send_result(self, ctx, result, filename):
+        """Sends the result, as a file if it doesn't fit in a message."""
+        author_notes = f'\n\n> {_("Texto por: {author}", author=ctx.author.mention)}'
+        if len(result) + len(author_notes) <= 2000:
+            return await ctx.send(result + author_notes)
+
+        buffer = io.BytesIO()
+        # Encoded in chunks, so there's never a second copy of the whole result.
+        for i in range(0, len(result), 64 * 1024):
+            buffer.write(result[i : i + 64 * 1024].encode('utf-8'))
+
+        buffer.seek(0)
+        await ctx.send(author_notes.strip(), file=discord.File(buffer, filename=filename))
+
+    async def _run_cipher(self, ctx, text, cipher, filename):
+        text = await self._read_input(ctx, text)
+        if text is None:
+            return
+        if not text:
+            return await ctx.send_help(ctx.command)
 
-            final += ' / '
+        try:
+            result = cipher(text)
+        except ValueError:
+            return await ctx.send(_('Código inválido.'))
 
-        author_notes = f'\n\n> {_("Texto por: {author}", author=ctx.author.mention)}'
-        await ctx.send(final[:-2] + author_notes)
+        if not result:
+            return await ctx.send(_('Nada para mostrar.'))
+        await self._send_result(ctx, result, filename)
+
+    @encrypt.command(name='morse')
+    async def encrypt_morse(self, ctx, *, text=''):
+        """Criptografar código morse."""
+        await self._run_cipher(ctx, text, ciphers.encode_morse, 'morse.txt')
 
     @decrypt.command(name='morse')
-    async def decrypt_morse(self, ctx, *, code):
+    async def decrypt_morse(self, ctx, *, code=''):
         """Descriptografar código morse."""
-        final = ''
-        code = code.split('/')
-
-        for word in code:
-            for char in word.split():
-                try:
-                    final += self.inverted_morse_table[char]
-                except KeyError:
-                    pass
-            final += ' '
-
-        author_notes = f'\n\n> {_("Texto por: {author}", author=ctx.author.mention)}'
-        await ctx.send(final + author_notes)
+        await self._run_cipher(ctx, code, ciphers.decode_morse, 'texto.txt')
+
+    @encrypt.command(name='caesar', aliases=['cesar'])
+    async def encrypt_caesar(self, ctx, shift: Optional[int] = 3, *, text=''):
+        """Criptografar com a cifra de César."""
+        await self._run_cipher(ctx, text, partial(ciphers.caesar, shift=shift), 'caesar.txt')
+
+    @decrypt.command(name='caesar', aliases=['cesar'])
+    async def decrypt_caesar(self, ctx, shift: Optional[int] = 3, *, code=''):
+        """Descriptografar a cifra de César."""
+        await self._run_cipher(ctx, code, partial(ciphers.caesar, shift=-shift), 'texto.txt')
+
+    @encrypt.command(name='vigenere')
+    async def encrypt_vigenere(self, ctx, key, *, text=''):
+        """Criptografar com a cifra de Vigenère."""
+        if not any(char in ascii_letters for char in key):
+            return await ctx.send(_('A chave precisa ter pelo menos uma letra.'))
+        await self._run_cipher(ctx, text, partial(ciphers.vigenere, key=key), 'vigenere.txt')
+
+    @decrypt.command(name='vigenere')
+    async def decrypt_vigenere(self, ctx, key, *, code=''):
+        """Descriptografar a cifra de Vigenère."""
+        if not any(char in ascii_letters for char in key):
+            return await ctx.send(_('A chave precisa ter pelo menos uma letra.'))
+        cipher = partial(ciphers.vigenere, key=key, decrypt=True)
+        await self._run_cipher(ctx, code, cipher, 'texto.txt')
+
+    async def _check_base(self, ctx, base):
+        if base in ciphers.BASES:
+            return True
+
+        bases = format_list([f'`{base}`' for base in ciphers.BASES], style='or')
+        await ctx.send(_('Escolha entre as bases {bases}.', bases=bases))
+        return False
+
+    @encrypt.command(name='base')
+    async def encrypt_base(self, ctx, base: int, *, text=''):
+        """Codifica o texto na base `2`, `8`, `10`, `16`, `32`, `64` ou `85`."""
+        if await self._check_base(ctx, base):
+            cipher = partial(ciphers.encode_base, base=base)
+            await self._run_cipher(ctx, text, cipher, f'base{base}.txt')
+
+    @decrypt.command(name='base')
+    async def decrypt_base(self, ctx, base: int, *, code=''):
+        """Decodifica o texto na base `2`, `8`, `10`, `16`, `32`, `64` ou `85`."""
+        if await self._check_base(ctx, base):
+            cipher = partial(ciphers.decode_base, base=base)
+            await self._run_cipher(ctx, code, cipher, 'texto.txt')
 
 
 def setup(bot):
@@ -224,3 +353,5 @@ def setup(bot):
 
 def teardown(bot):
     sys.modules.pop('kaibot.cogs.resources.brainfuck')
+    sys.modules.pop('kaibot.cogs.resources.ciphers', None)
+    sys.modules.pop('kaibot.cogs.resources.text_transforms', None)
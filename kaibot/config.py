@@ -2,6 +2,28 @@ DEFAULT_LANGUAGE = 'pt_BR'
 
 PREFIXES = ('k.', 'kaibot ')
 
+# Batch the database writes instead of awaiting each one.
+DB_WRITE_BEHIND = False
+# Keep the cache in sync with other processes (needs a replica set).
+DB_WATCH_CHANGES = False
+# Type of the guild _ids: 'str' (legacy), 'int', or 'both' while running
+# kaibot.scripts.migrate_ids (int, but str ids are still read).
+DB_ID_MODE = 'str'
+
+# Limits of k.brainfuck decode, the programs run in separate processes.
+BF_WORKERS = 2
+BF_TIMEOUT = 10
+BF_MAX_INSTRUCTIONS = 100_000_000
+BF_MAX_CELLS = 100_000
+BF_MEMORY_LIMIT = 512 * 1024 * 1024
+# CPU seconds spent searching for a shorter k.brainfuck encode.
+BF_ENCODE_BUDGET = 0.1
+
+# Limits of k.resolve, the timeout is for the whole chain of redirects.
+RESOLVE_TIMEOUT = 15
+RESOLVE_PER_HOST = 2
+RESOLVE_CACHE_TTL = 600
+
 INTENTS = ('guilds', 'messages', 'reactions', 'members')
 
 MAIN_COLOR = 0xFF6EFF
@@ -0,0 +1,41 @@
+"""
+Imports modules as they were in an older commit, so the benchmarks can
+compare with the code they replaced without keeping a copy of it.
+"""
+import subprocess
+import types
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+# The last commit before the optimized LRU cache, Tic-Tac-Toe engine and
+# Brainfuck interpreter.
+REVISION = '66a1f4fc160b508c343df0c7f52df46483edc026'
+
+
+def load_module(name, revision=REVISION):
+    """
+    Imports the module `name` (e.g. 'kaibot.utils.database') from the
+    revision, without touching sys.modules. Relative imports get the
+    current version of the other modules.
+    """
+    path = name.replace('.', '/') + '.py'
+    process = subprocess.run(
+        ['git', 'show', f'{revision}:{path}'], cwd=ROOT, capture_output=True, text=True
+    )
+    if process.returncode:
+        raise RuntimeError(f"Couldn't read {path} at {revision}: {process.stderr.strip()}")
+
+    module = types.ModuleType(name)
+    module.__package__ = name.rpartition('.')[0]
+    module.__file__ = str(ROOT / path)
+    exec(compile(process.stdout, f'{revision[:7]}:{path}', 'exec'), module.__dict__)
+    return module
+
+
+def add_argument(parser):
+    parser.add_argument(
+        '--revision',
+        default=REVISION,
+        help='The commit to compare with (default: the one before the optimizations).',
+    )
@@ -0,0 +1,77 @@
+"""Runs classic Brainfuck programs with the compiled and the old interpreter."""
+import argparse
+import logging
+import sys
+import time
+
+from ..cogs.resources.brainfuck import BrainfuckDecoder, compile_brainfuck
+from .baseline import REVISION, add_argument, load_module
+
+log = logging.getLogger('kaibot.bf_benchmark')
+
+BF_INPUT = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789'
+
+PROGRAMS = {
+    'hello': (
+        '++++++++[>++++[>++>+++>+++>+<<<<-]>+>+>->>+[<]<-]'
+        '>>.>---.+++++++..+++.>>.<-.<.+++.------.--------.>>+.>++.'
+    ),
+    'alphabet': '+++++[>+++++<-]>+>++++++++[>++++++++<-]>+<<[>>.+<<-]',
+    # Reads past the end of the input, which starts over.
+    'input': ',.' * 70,
+    # 12 ** 4 iterations of the inner loop.
+    'nested': (
+        '++++++++++++[>++++++++++++[>++++++++++++[>++++++++++++' + '[>+>+<<-]>[-]<<-]<-]<-]<-]'
+    ),
+    # Sums 1..400 into the next cell, 80k iterations.
+    'triangle': '+' * 400 + '[[->+>+<<]>>[-<<+>>]<<->[-]<]',
+}
+
+
+def _timed(decoder_cls, code):
+    decoder = decoder_cls(BF_INPUT)
+    start = time.perf_counter()
+    output = decoder(code)
+    elapsed = time.perf_counter() - start
+    memory = {ptr: value for ptr, value in decoder.mem.items() if value}
+    return output, memory, elapsed
+
+
+def main(names=None, revision=REVISION):
+    legacy_cls = load_module('kaibot.cogs.resources.brainfuck', revision).BrainfuckDecoder
+    failed = False
+    for name in names or PROGRAMS:
+        code = PROGRAMS[name]
+        program = compile_brainfuck(code)
+
+        output, memory, elapsed = _timed(BrainfuckDecoder, code)
+        legacy_output, legacy_memory, legacy_elapsed = _timed(legacy_cls, code)
+
+        if (output, memory) != (legacy_output, legacy_memory):
+            log.error(f'{name}: the output or the memory differs from the old interpreter.')
+            failed = True
+
+        log.info(
+            f'{name:>10}: {len(code)} chars -> {len(program.ops)} ops, '
+            f'{elapsed * 1000:.2f}ms (old: {legacy_elapsed * 1000:.2f}ms, '
+            f'{legacy_elapsed / elapsed:.1f}x)'
+        )
+
+    return int(failed)
+
+
+if __name__ == '__main__':
+    handler = logging.StreamHandler()
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('programs', nargs='*', help=', '.join(PROGRAMS))
+    add_argument(parser)
+    options = parser.parse_args()
+
+    unknown = set(options.programs) - PROGRAMS.keys()
+    if unknown:
+        parser.error(f'Unknown programs: {", ".join(unknown)}')
+
+    sys.exit(main(options.programs, options.revision))
@@ -0,0 +1,67 @@
+"""Encodes texts of different sizes, checking the programs print them back."""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from ..cogs.resources.brainfuck import BrainfuckDecoder, encode_brainfuck
+
+log = logging.getLogger('kaibot.bf_encode_benchmark')
+
+ALPHABETS = {
+    'ascii': 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .,!?',
+    'portuguese': 'abcdefghijklmnopqrstuvwxyzáàâãéêíóôõúç ',
+    'emoji': '😀🎉✨👍 abc',
+}
+
+
+def _naive(text):
+    """One cell, only + and -."""
+    code = []
+    value = 0
+    for char in text:
+        delta = ord(char) - value
+        code.append(('+' * delta if delta > 0 else '-' * -delta) + '.')
+        value = ord(char)
+    return ''.join(code)
+
+
+def main(sizes=(10, 100, 500, 1000), budget=0.1, seed=0):
+    rng = random.Random(seed)
+    failed = False
+    for name, alphabet in ALPHABETS.items():
+        for size in sizes:
+            # Words from a few characters, so the text repeats like real text.
+            chars = alphabet[: rng.randint(3, len(alphabet))]
+            text = ''.join(rng.choice(chars) for _ in range(size))
+
+            start = time.thread_time()
+            code = encode_brainfuck(text, budget=budget)
+            elapsed = time.thread_time() - start
+
+            if BrainfuckDecoder('')(code) != text:
+                log.error(f'{name} ({size}): the program does not print the text.')
+                failed = True
+
+            naive = len(_naive(text))
+            log.info(
+                f'{name:>10} {size:>5} chars: {len(code):>6} ({len(code) / naive:.0%} of naive, '
+                f'{len(code) / size:.1f}/char) in {elapsed * 1000:.0f}ms of CPU'
+            )
+
+    return int(failed)
+
+
+if __name__ == '__main__':
+    handler = logging.StreamHandler()
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 500, 1000])
+    parser.add_argument('--budget', type=float, default=0.1, help='CPU seconds per text.')
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    sys.exit(main(options.sizes, options.budget, options.seed))
@@ -0,0 +1,93 @@
+"""Compares utils.database.LRUCache with the old deque based cache."""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from ..utils.database import LRUCache
+from .baseline import REVISION, add_argument, load_module
+
+log = logging.getLogger('kaibot.lru_benchmark')
+
+SIZES = (500, 10_000, 100_000)
+
+
+def _workload(size, ops, seed):
+    """90% lookups of cached keys, 10% inserts of new keys."""
+    rng = random.Random(seed)
+    workload = []
+    next_key = size
+    for _ in range(ops):
+        if rng.random() < 0.9:
+            workload.append((True, str(rng.randrange(size))))
+        else:
+            workload.append((False, str(next_key)))
+            next_key += 1
+    return workload
+
+
+def _run(cache, workload):
+    get = cache.get
+    insert = cache.insert
+
+    start = time.perf_counter()
+    for is_get, key in workload:
+        if is_get:
+            get(key)
+        else:
+            insert(key, key)
+    return time.perf_counter() - start
+
+
+def _filled_legacy(legacy_cls, size, keys):
+    # Filling through insert is quadratic, so build it directly.
+    cache = legacy_cls(size)
+    cache._LRUCache__container.extend((key, key) for key in reversed(keys))
+    cache._reallocate()
+    return cache
+
+
+def bench(size, ops, legacy_cls):
+    keys = [str(n) for n in range(size)]
+
+    cache = LRUCache(size)
+    for key in keys:
+        cache.insert(key, key)
+    new_time = _run(cache, _workload(size, ops, size))
+
+    # The old cache rebuilds its index on every operation, limit the
+    # number of operations so big sizes finish in a sane time.
+    legacy_ops = min(ops, max(100, 5_000_000 // size))
+    legacy = _filled_legacy(legacy_cls, size, keys)
+    legacy_time = _run(legacy, _workload(size, legacy_ops, size))
+
+    new_us = new_time / ops * 1e6
+    legacy_us = legacy_time / legacy_ops * 1e6
+    return new_us, legacy_us
+
+
+def main(sizes=SIZES, ops=100_000, revision=REVISION):
+    legacy_cls = load_module('kaibot.utils.database', revision).LRUCache
+
+    log.info(f'{"size":>8} | {"LRUCache":>14} | {"legacy":>14} | {"speedup":>8}')
+    for size in sizes:
+        new_us, legacy_us = bench(size, ops, legacy_cls)
+        log.info(
+            f'{size:>8} | {new_us:>11.3f} us | {legacy_us:>11.3f} us | {legacy_us / new_us:>7.0f}x'
+        )
+    return 0
+
+
+if __name__ == '__main__':
+    handler = logging.StreamHandler()
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--ops', type=int, default=100_000, help='Operations per size.')
+    parser.add_argument('sizes', type=int, nargs='*', default=SIZES)
+    add_argument(parser)
+    options = parser.parse_args()
+
+    sys.exit(main(options.sizes, options.ops, options.revision))
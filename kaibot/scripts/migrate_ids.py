@@ -0,0 +1,102 @@
+"""
+Rewrites the documents keyed by str(id) to int64 ids.
+
+No downtime is needed:
+1. Run the bot with DB_ID_MODE = 'both', so it reads both keys and
+   copies the documents it loads.
+2. Run this script.
+3. Switch to DB_ID_MODE = 'int'.
+
+The copies use $setOnInsert, so documents already copied (by the bot
+or a previous run) are never overwritten.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from ..utils import backends
+from ..utils.backends import Write
+
+log = logging.getLogger('kaibot.migrate_ids')
+
+
+def _is_legacy(id):
+    return isinstance(id, str) and id.isdigit()
+
+
+async def migrate(collection, *, batch_size=500, dry_run=False):
+    # Only the ids are kept in memory, documents are read per batch.
+    ids = [
+        data['_id']
+        async for data in collection.find({}, {'_id': 1}, batch_size=batch_size)
+        if _is_legacy(data['_id'])
+    ]
+    total = len(ids)
+    log.info(f'{total} documents to migrate.')
+
+    if dry_run or not total:
+        return total
+
+    start = time.perf_counter()
+    done = 0
+    for i in range(0, total, batch_size):
+        batch = ids[i : i + batch_size]
+
+        copies = []
+        async for data in collection.find({'_id': {'$in': batch}}, batch_size=batch_size):
+            fields = {k: v for k, v in data.items() if k != '_id'}
+            copies.append(Write('update', int(data['_id']), {'$setOnInsert': fields}, True))
+
+        # Copy first, so readers always find one of them.
+        await collection.bulk_write(copies)
+        await collection.bulk_write([Write('delete', id) for id in batch])
+
+        done += len(batch)
+        elapsed = time.perf_counter() - start
+        log.info(
+            f'Migrated {done}/{total} ({done / total:.0%}) documents, '
+            f'{done / elapsed:.0f} documents/s.'
+        )
+
+    return total
+
+
+async def main(uri, database, collection, *, batch_size=500, dry_run=False):
+    backend = backends.from_uri(uri, database)
+    try:
+        await migrate(backend.collection(collection), batch_size=batch_size, dry_run=dry_run)
+    finally:
+        await backend.close()
+    return 0
+
+
+if __name__ == '__main__':
+    handler = logging.StreamHandler()
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=os.getenv('DATABASE_URI') or os.getenv('MONGO_URI'))
+    parser.add_argument('--database', default='KaiBOT')
+    parser.add_argument('--collection', default='Guilds')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='Only count the documents.')
+    options = parser.parse_args()
+
+    if not options.uri:
+        parser.error('--uri, DATABASE_URI or MONGO_URI must be set.')
+
+    sys.exit(
+        asyncio.run(
+            main(
+                options.uri,
+                options.database,
+                options.collection,
+                batch_size=options.batch_size,
+                dry_run=options.dry_run,
+            )
+        )
+    )
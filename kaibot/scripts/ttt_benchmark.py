@@ -0,0 +1,67 @@
+"""Plays random Tic-Tac-Toe games with the bitboard and the old engine."""
+import argparse
+import logging
+import random
+import sys
+import time
+
+from ..cogs.games.ttt import TTTImplementation
+from .baseline import REVISION, add_argument, load_module
+
+log = logging.getLogger('kaibot.ttt_benchmark')
+
+
+def _games(count, seed):
+    """Random move orders, so both engines play the same games."""
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        moves = list(range(9))
+        rng.shuffle(moves)
+        games.append(moves)
+    return games
+
+
+def play(engine_cls, games):
+    """Returns the number of moves played and the time it took."""
+    moves_played = 0
+    start = time.perf_counter()
+    for moves in games:
+        game = engine_cls()
+        for move in moves:
+            game.make_move(move)
+            moves_played += 1
+            # The integration reads the winner about 3 times per move.
+            game.winner
+            game.winner
+            if game.winner is not None:
+                break
+    return moves_played, time.perf_counter() - start
+
+
+def main(count=100_000, seed=0, revision=REVISION):
+    legacy_cls = load_module('kaibot.cogs.games.ttt', revision).TTTImplementation
+    games = _games(count, seed)
+
+    results = {}
+    for name, engine_cls in (('bitboard', TTTImplementation), ('legacy', legacy_cls)):
+        moves, elapsed = play(engine_cls, games)
+        results[name] = elapsed / moves * 1e9
+        log.info(f'{name:>8}: {moves} moves in {elapsed:.3f}s, {results[name]:.0f} ns/move')
+
+    log.info(f'Speedup: {results["legacy"] / results["bitboard"]:.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    handler = logging.StreamHandler()
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--games', type=int, default=100_000)
+    parser.add_argument('--seed', type=int, default=0)
+    add_argument(parser)
+    options = parser.parse_args()
+
+    sys.exit(main(options.games, options.seed, options.revision))
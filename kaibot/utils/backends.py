@@ -0,0 +1,581 @@
+"""
+Storage backends used by utils.database.
+
+A backend gives a CollectionBackend for each collection name. Updates
+use MongoDB's update operators ($set, $setOnInsert, $unset, $inc,
+$addToSet and $pull) whatever the backend is, and bulk writes are lists
+of Write.
+"""
+import asyncio
+import json
+from copy import deepcopy
+from typing import Any, NamedTuple, Optional
+
+_MISSING = object()
+
+
+class BackendError(Exception):
+    pass
+
+
+class BulkWriteError(BackendError):
+    """Some of the writes were rejected, retrying them won't help."""
+
+
+class Change(NamedTuple):
+    """A change made to a document by any writer."""
+
+    # 'update' (inserts and replaces included) or 'delete'.
+    kind: str
+    id: Any
+    # The document after the change, None if unknown.
+    document: Optional[dict] = None
+
+
+class Write(NamedTuple):
+    """A single operation of a bulk write."""
+
+    # One of 'update', 'replace' or 'delete'.
+    kind: str
+    id: Any
+    # The update for 'update', the full document for 'replace'.
+    document: Optional[dict] = None
+    upsert: bool = False
+
+
+# Helpers #
+
+
+def apply_update(document, update, *, inserting=False):
+    """Applies the update operators to the document, in place."""
+    for operator, fields in update.items():
+        if operator == '$set':
+            document.update(deepcopy(fields))
+
+        elif operator == '$setOnInsert':
+            if inserting:
+                document.update(deepcopy(fields))
+
+        elif operator == '$unset':
+            for key in fields:
+                document.pop(key, None)
+
+        elif operator == '$inc':
+            for key, value in fields.items():
+                document[key] = document.get(key, 0) + value
+
+        elif operator == '$addToSet':
+            for key, value in fields.items():
+                values = value['$each'] if isinstance(value, dict) else [value]
+                array = document.get(key)
+                if array is None:
+                    array = document[key] = []
+                for item in values:
+                    if item not in array:
+                        array.append(deepcopy(item))
+
+        elif operator == '$pull':
+            for key, value in fields.items():
+                values = value['$in'] if isinstance(value, dict) else [value]
+                if document.get(key) is not None:
+                    document[key] = [item for item in document[key] if item not in values]
+
+        else:
+            raise BackendError(f'Unsupported update operator: {operator}')
+
+    return document
+
+
+def matches(document, filter):
+    """Supports equality and the $in, $nin, $ne and $exists operators."""
+    for key, condition in filter.items():
+        value = document.get(key, _MISSING)
+
+        if not isinstance(condition, dict):
+            if value is _MISSING or value != condition:
+                return False
+            continue
+
+        for operator, operand in condition.items():
+            if operator == '$in':
+                ok = value is not _MISSING and value in operand
+            elif operator == '$nin':
+                ok = value is _MISSING or value not in operand
+            elif operator == '$ne':
+                ok = value is _MISSING or value != operand
+            elif operator == '$exists':
+                ok = (value is not _MISSING) == bool(operand)
+            else:
+                raise BackendError(f'Unsupported query operator: {operator}')
+
+            if not ok:
+                return False
+
+    return True
+
+
+def project(document, projection):
+    """Supports inclusion projections only."""
+    if not projection:
+        return document
+
+    result = {'_id': document['_id']} if projection.get('_id', 1) else {}
+    for key, include in projection.items():
+        if include and key != '_id' and key in document:
+            result[key] = document[key]
+    return result
+
+
+def _new_document(id, update):
+    """The document an upsert creates."""
+    document = {'_id': id}
+    return apply_update(document, update, inserting=True)
+
+
+# Base #
+
+
+class CollectionBackend:
+    async def find_one(self, id, projection=None):
+        """Returns the document, or None."""
+        raise NotImplementedError
+
+    def find(self, filter=None, projection=None, *, batch_size=None):
+        """Async iterator over the matching documents."""
+        raise NotImplementedError
+
+    async def insert_one(self, document):
+        raise NotImplementedError
+
+    async def update_one(self, id, update, *, upsert=False):
+        raise NotImplementedError
+
+    async def replace_one(self, id, document, *, upsert=False):
+        raise NotImplementedError
+
+    async def delete_one(self, id):
+        raise NotImplementedError
+
+    async def bulk_write(self, writes):
+        """Applies the writes in any order. Raises BulkWriteError."""
+        errors = []
+        for write in writes:
+            try:
+                await self._write(write)
+            except BackendError as e:
+                errors.append(e)
+
+        if errors:
+            raise BulkWriteError(errors)
+
+    def _write(self, write):
+        if write.kind == 'update':
+            return self.update_one(write.id, write.document, upsert=write.upsert)
+        if write.kind == 'replace':
+            return self.replace_one(write.id, write.document, upsert=write.upsert)
+        if write.kind == 'delete':
+            return self.delete_one(write.id)
+        raise BackendError(f'Unknown write kind: {write.kind}')
+
+    def watch(self):
+        """
+        Async iterator over the changes made to the collection, by this
+        or any other process. Not every backend supports it.
+
+        The first item is None, once the stream is open. Changes made
+        before it aren't seen.
+        """
+        raise NotImplementedError(f'{type(self).__name__} does not support watching changes.')
+
+    async def ping(self):
+        pass
+
+
+class Backend:
+    def collection(self, name) -> CollectionBackend:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+# Motor #
+
+
+class MotorCollectionBackend(CollectionBackend):
+    __slots__ = ('collection',)
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find_one(self, id, projection=None):
+        return self.collection.find_one({'_id': id}, projection)
+
+    async def find(self, filter=None, projection=None, *, batch_size=None):
+        cursor = self.collection.find(filter or {}, projection)
+        if batch_size is not None:
+            cursor = cursor.batch_size(batch_size)
+
+        async for document in cursor:
+            yield document
+
+    async def insert_one(self, document):
+        await self.collection.insert_one(document)
+
+    async def update_one(self, id, update, *, upsert=False):
+        await self.collection.update_one({'_id': id}, update, upsert=upsert)
+
+    async def replace_one(self, id, document, *, upsert=False):
+        await self.collection.replace_one({'_id': id}, document, upsert=upsert)
+
+    async def delete_one(self, id):
+        await self.collection.delete_one({'_id': id})
+
+    async def bulk_write(self, writes):
+        from pymongo import DeleteOne, ReplaceOne, UpdateOne
+        from pymongo.errors import BulkWriteError as PyMongoBulkWriteError
+
+        operations = []
+        for write in writes:
+            if write.kind == 'update':
+                operations.append(UpdateOne({'_id': write.id}, write.document, upsert=write.upsert))
+            elif write.kind == 'replace':
+                operations.append(
+                    ReplaceOne({'_id': write.id}, write.document, upsert=write.upsert)
+                )
+            elif write.kind == 'delete':
+                operations.append(DeleteOne({'_id': write.id}))
+            else:
+                raise BackendError(f'Unknown write kind: {write.kind}')
+
+        if not operations:
+            return
+
+        try:
+            await self.collection.bulk_write(operations, ordered=False)
+        except PyMongoBulkWriteError as e:
+            raise BulkWriteError(e.details) from e
+
+    async def watch(self):
+        # Needs a replica set (change streams aren't available otherwise).
+        pipeline = [
+            {'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}
+        ]
+        async with self.collection.watch(pipeline, full_document='updateLookup') as stream:
+            # Motor opens the stream lazily, try_next() opens it without
+            # waiting for a change.
+            event = await stream.try_next()
+            yield None
+
+            while True:
+                if event is not None:
+                    id = event['documentKey']['_id']
+                    if event['operationType'] == 'delete':
+                        yield Change('delete', id)
+                    else:
+                        yield Change('update', id, event.get('fullDocument'))
+                event = await stream.next()
+
+    async def ping(self):
+        await self.collection.database.command('ping')
+
+
+class MotorBackend(Backend):
+    def __init__(self, uri, name):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        self.client = AsyncIOMotorClient(uri)
+        self.db = self.client[name]
+
+    def collection(self, name):
+        return MotorCollectionBackend(self.db[name])
+
+    async def close(self):
+        self.client.close()
+
+
+# Memory #
+
+
+class MemoryCollectionBackend(CollectionBackend):
+    """
+    Keeps the documents in a dict. Useful for tests and benchmarks.
+
+    Watching is a local pub/sub, so managers sharing a MemoryBackend
+    behave like processes sharing a database.
+    """
+
+    __slots__ = ('documents', 'watchers')
+
+    def __init__(self):
+        self.documents = {}
+        # Queues of the running watch() iterators.
+        self.watchers = set()
+
+    def _publish(self, id):
+        if not self.watchers:
+            return
+
+        document = self.documents.get(id)
+        if document is None:
+            change = Change('delete', id)
+        else:
+            change = Change('update', id, deepcopy(document))
+
+        for queue in self.watchers:
+            queue.put_nowait(change)
+
+    async def watch(self):
+        queue = asyncio.Queue()
+        self.watchers.add(queue)
+        try:
+            yield None
+            while True:
+                yield await queue.get()
+        finally:
+            self.watchers.discard(queue)
+
+    async def find_one(self, id, projection=None):
+        document = self.documents.get(id)
+        if document is None:
+            return None
+        return project(deepcopy(document), projection)
+
+    async def find(self, filter=None, projection=None, *, batch_size=None):
+        ids = None
+        if filter and isinstance(filter.get('_id'), dict) and '$in' in filter['_id']:
+            ids = filter['_id']['$in']
+
+        if ids is None:
+            documents = list(self.documents.values())
+        else:
+            documents = [self.documents[id] for id in ids if id in self.documents]
+
+        for document in documents:
+            if not filter or matches(document, filter):
+                yield project(deepcopy(document), projection)
+
+    async def insert_one(self, document):
+        id = document['_id']
+        if id in self.documents:
+            raise BackendError(f'Duplicate key: {id!r}')
+        self.documents[id] = deepcopy(document)
+        self._publish(id)
+
+    async def update_one(self, id, update, *, upsert=False):
+        document = self.documents.get(id)
+        if document is not None:
+            apply_update(document, update)
+        elif upsert:
+            self.documents[id] = _new_document(id, update)
+        else:
+            return
+        self._publish(id)
+
+    async def replace_one(self, id, document, *, upsert=False):
+        if id in self.documents or upsert:
+            self.documents[id] = deepcopy({**document, '_id': id})
+            self._publish(id)
+
+    async def delete_one(self, id):
+        if self.documents.pop(id, None) is not None:
+            self._publish(id)
+
+
+class MemoryBackend(Backend):
+    def __init__(self):
+        self.collections = {}
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = MemoryCollectionBackend()
+        return self.collections[name]
+
+
+# SQLite #
+
+
+class SQLiteCollectionBackend(CollectionBackend):
+    """
+    Stores every document as JSON in a (id, data) table. Updates are
+    read-modify-write inside a transaction.
+    """
+
+    # SQLite's default limit of variables per statement is 999.
+    MAX_VARIABLES = 900
+
+    __slots__ = ('backend', 'table')
+
+    def __init__(self, backend, name):
+        self.backend = backend
+        self.table = '"' + name.replace('"', '""') + '"'
+
+    async def _connection(self):
+        return await self.backend.connection(self.table)
+
+    async def find_one(self, id, projection=None):
+        db = await self._connection()
+        async with db.execute(f'SELECT data FROM {self.table} WHERE id = ?', (id,)) as cursor:
+            row = await cursor.fetchone()
+
+        if row is None:
+            return None
+        return project(json.loads(row[0]), projection)
+
+    async def find(self, filter=None, projection=None, *, batch_size=None):
+        db = await self._connection()
+        batch_size = batch_size or 100
+
+        ids = None
+        if filter and isinstance(filter.get('_id'), dict) and '$in' in filter['_id']:
+            ids = list(filter['_id']['$in'])
+
+        if ids is None:
+            queries = [(f'SELECT data FROM {self.table}', ())]
+        else:
+            queries = []
+            for i in range(0, len(ids), self.MAX_VARIABLES):
+                chunk = ids[i : i + self.MAX_VARIABLES]
+                marks = ', '.join('?' * len(chunk))
+                queries.append((f'SELECT data FROM {self.table} WHERE id IN ({marks})', chunk))
+
+        for query, params in queries:
+            async with db.execute(query, params) as cursor:
+                while rows := await cursor.fetchmany(batch_size):
+                    for (data,) in rows:
+                        document = json.loads(data)
+                        if not filter or matches(document, filter):
+                            yield project(document, projection)
+
+    async def _put(self, db, id, document):
+        await db.execute(
+            f'INSERT OR REPLACE INTO {self.table} (id, data) VALUES (?, ?)',
+            (id, json.dumps(document)),
+        )
+
+    async def _update(self, db, id, update, upsert):
+        async with db.execute(f'SELECT data FROM {self.table} WHERE id = ?', (id,)) as cursor:
+            row = await cursor.fetchone()
+
+        if row is not None:
+            await self._put(db, id, apply_update(json.loads(row[0]), update))
+        elif upsert:
+            await self._put(db, id, _new_document(id, update))
+
+    async def _apply(self, write):
+        db = await self._connection()
+        async with self.backend.lock:
+            # sqlite3 would only begin the transaction at the first write,
+            # after the reads. Other processes can't write until we commit.
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                await write(db)
+            except Exception:
+                await db.rollback()
+                raise
+            await db.commit()
+
+    async def insert_one(self, document):
+        import sqlite3
+
+        async def write(db):
+            try:
+                await db.execute(
+                    f'INSERT INTO {self.table} (id, data) VALUES (?, ?)',
+                    (document['_id'], json.dumps(document)),
+                )
+            except sqlite3.IntegrityError as e:
+                raise BackendError(f'Duplicate key: {document["_id"]!r}') from e
+
+        await self._apply(write)
+
+    async def update_one(self, id, update, *, upsert=False):
+        await self._apply(lambda db: self._update(db, id, update, upsert))
+
+    async def replace_one(self, id, document, *, upsert=False):
+        async def write(db):
+            if not upsert:
+                query = f'SELECT 1 FROM {self.table} WHERE id = ?'
+                async with db.execute(query, (id,)) as cursor:
+                    if await cursor.fetchone() is None:
+                        return
+            await self._put(db, id, {**document, '_id': id})
+
+        await self._apply(write)
+
+    async def delete_one(self, id):
+        await self._apply(lambda db: db.execute(f'DELETE FROM {self.table} WHERE id = ?', (id,)))
+
+    async def bulk_write(self, writes):
+        # A single transaction for all of them.
+        async def write(db):
+            for write in writes:
+                if write.kind == 'update':
+                    await self._update(db, write.id, write.document, write.upsert)
+                elif write.kind == 'replace':
+                    await self._put(db, write.id, {**write.document, '_id': write.id})
+                elif write.kind == 'delete':
+                    await db.execute(f'DELETE FROM {self.table} WHERE id = ?', (write.id,))
+                else:
+                    raise BulkWriteError(f'Unknown write kind: {write.kind}')
+
+        await self._apply(write)
+
+    async def ping(self):
+        db = await self._connection()
+        async with db.execute('SELECT 1') as cursor:
+            await cursor.fetchone()
+
+
+class SQLiteBackend(Backend):
+    """Needs aiosqlite. The database is opened in WAL mode."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = asyncio.Lock()
+        self.__db = None
+        self.__tables = set()
+
+    async def connection(self, table):
+        if self.__db is None or table not in self.__tables:
+            async with self.lock:
+                if self.__db is None:
+                    import aiosqlite
+
+                    db = await aiosqlite.connect(self.path)
+                    await db.execute('PRAGMA journal_mode=WAL')
+                    await db.execute('PRAGMA synchronous=NORMAL')
+                    self.__db = db
+
+                if table not in self.__tables:
+                    # Without a type, the ids keep theirs (str or int).
+                    await self.__db.execute(
+                        f'CREATE TABLE IF NOT EXISTS {table} (id PRIMARY KEY, data TEXT NOT NULL)'
+                    )
+                    await self.__db.commit()
+                    self.__tables.add(table)
+
+        return self.__db
+
+    def collection(self, name):
+        return SQLiteCollectionBackend(self, name)
+
+    async def close(self):
+        if self.__db is not None:
+            await self.__db.close()
+            self.__db = None
+
+
+def from_uri(uri, name):
+    """
+    Creates the backend for the uri:
+    - memory:// for MemoryBackend.
+    - sqlite:///kaibot.db (relative) or sqlite:////abs/kaibot.db for
+      SQLiteBackend.
+    - Anything else is a MongoDB uri.
+    """
+    if uri.startswith('memory://'):
+        return MemoryBackend()
+    if uri.startswith('sqlite:///'):
+        return SQLiteBackend(uri[len('sqlite:///') :])
+    return MotorBackend(uri, name)
@@ -0,0 +1,80 @@
+class ChannelActivity:
+    """
+    Counts the messages sent after tracked messages, from the gateway
+    events, so we don't need to fetch the channel history.
+
+    The message events are only listened to while a channel is tracked,
+    since discord.py creates a task for each event a listener gets.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        # channel_id -> {message_id: messages after it, or None if unknown}
+        self.__channels = {}
+
+        bot.add_listener(self.on_ready)
+
+    def destroy(self):
+        self._remove_listeners()
+        self.bot.remove_listener(self.on_ready)
+        self.__channels = {}
+
+    def _remove_listeners(self):
+        self.bot.remove_listener(self.on_message)
+        self.bot.remove_listener(self.on_raw_message_delete)
+
+    def track(self, message, count=0):
+        if not self.__channels:
+            self.bot.add_listener(self.on_message)
+            self.bot.add_listener(self.on_raw_message_delete)
+
+        self.__channels.setdefault(message.channel.id, {})[message.id] = count
+
+    def untrack(self, message):
+        tracked = self.__channels.get(message.channel.id)
+        if tracked is None:
+            return
+
+        tracked.pop(message.id, None)
+        if not tracked:
+            del self.__channels[message.channel.id]
+            if not self.__channels:
+                self._remove_listeners()
+
+    def messages_after(self, message):
+        """
+        The number of messages sent after `message`, or None if it isn't
+        tracked or we may have missed events since then.
+        """
+        tracked = self.__channels.get(message.channel.id)
+        if tracked is None:
+            return None
+        return tracked.get(message.id)
+
+    # LISTENERS
+
+    async def on_message(self, message):
+        tracked = self.__channels.get(message.channel.id)
+        if tracked is None:
+            return
+
+        for message_id, count in tracked.items():
+            if count is not None and message.id > message_id:
+                tracked[message_id] = count + 1
+
+    async def on_raw_message_delete(self, payload):
+        tracked = self.__channels.get(payload.channel_id)
+        if tracked is None:
+            return
+
+        for message_id, count in tracked.items():
+            # Snowflakes are ordered by time.
+            if count and payload.message_id > message_id:
+                tracked[message_id] = count - 1
+
+    async def on_ready(self):
+        # A new session means the events since the disconnect are lost,
+        # resumed sessions replay them and don't dispatch this.
+        for tracked in self.__channels.values():
+            for message_id in tracked:
+                tracked[message_id] = None
@@ -1,7 +1,13 @@
+import asyncio
+import logging
 import time
-from collections import deque
+from collections import OrderedDict
+from copy import deepcopy
+from typing import NamedTuple, Optional
 
-from pymongo import ReturnDocument
+from .backends import BulkWriteError, Write
+
+log = logging.getLogger('kaibot.database')
 
 
 class _missing:
@@ -11,13 +17,55 @@ class _missing:
 MISSING = _missing()
 
 
+class _not_found:
+    """Cached in place of documents that don't exist."""
+
+    obj = object()
+
+
+NOT_FOUND = _not_found()
+
+
+def _snapshot(data):
+    """Copies the mutable values, so in place changes can be detected."""
+    return {
+        k: v if isinstance(v, (str, int, float, bool, type(None))) else deepcopy(v)
+        for k, v in data.items()
+    }
+
+
+def _array_changes(old, new):
+    """
+    Returns the items added to and removed from the array, or None if
+    the change can't be expressed with $addToSet or $pull alone.
+    """
+    try:
+        if len(set(old)) != len(old) or len(set(new)) != len(new):
+            return None
+    except TypeError:
+        # Unhashable items.
+        return None
+
+    added = [v for v in new if v not in old]
+    removed = [v for v in old if v not in new]
+    if added and removed:
+        return None
+    if new != [v for v in old if v not in removed] + added:
+        # Reordered.
+        return None
+
+    return added, removed
+
+
 class Document:
-    __slots__ = ('__collection', '__data')
+    __slots__ = ('__collection', '__data', '__original')
 
     def __init__(self, data, collection):
         # Don't call our __setattr__
         object.__setattr__(self, '_Document__collection', collection)
         object.__setattr__(self, '_Document__data', data)
+        # The data as it was on the last load or sync.
+        object.__setattr__(self, '_Document__original', _snapshot(data))
 
     def __iter__(self):
         return iter(self.__data.items())
@@ -31,101 +79,634 @@ class Document:
     def __setattr__(self, attr, value):
         self.__data[attr] = value
 
+    def __delattr__(self, attr):
+        try:
+            del self.__data[attr]
+        except KeyError:
+            raise AttributeError(f"'Document' object has no attribute '{attr}'") from None
+
     def __getitem__(self, item):
         return self.__getattr__(item)
 
     def __setitem__(self, item, value):
         self.__setattr__(item, value)
 
+    def __delitem__(self, item):
+        self.__delattr__(item)
+
     def update(self, data):
         self.__data.update(data)
 
-    def sync(self):
-        return self.__collection.update(self._id, 'set', self.__data)
+    def _changes(self, *, array_operators=True):
+        """
+        Returns the update for the fields changed since the last load or
+        sync. In place array changes become $addToSet/$pull if possible.
+        """
+        data = self.__data
+        original = self.__original
+
+        update = {}
+        for key, value in data.items():
+            if key == '_id':
+                continue
+
+            old = original.get(key, MISSING)
+            if old is not MISSING and old == value:
+                continue
+
+            if array_operators and isinstance(old, list) and isinstance(value, list):
+                changes = _array_changes(old, value)
+                if changes is not None:
+                    added, removed = changes
+                    if added:
+                        update.setdefault('$addToSet', {})[key] = {'$each': added}
+                    else:
+                        update.setdefault('$pull', {})[key] = {'$in': removed}
+                    continue
+
+            update.setdefault('$set', {})[key] = value
+
+        for key in original.keys() - data.keys():
+            update.setdefault('$unset', {})[key] = ''
+
+        return update
+
+    def _reload(self, data):
+        """Replaces the data with a newer version, as if it was just loaded."""
+        current = self.__data
+        current.clear()
+        current.update(data)
+        self._mark_clean()
+
+    def _mark_clean(self, keys=None):
+        """Marks the given fields (or all) as synced."""
+        if keys is None:
+            object.__setattr__(self, '_Document__original', _snapshot(self.__data))
+            return
+
+        data = self.__data
+        original = self.__original
+        for key in keys:
+            if key in data:
+                original.update(_snapshot({key: data[key]}))
+            else:
+                original.pop(key, None)
+
+    async def sync(self):
+        """Writes only the fields that changed since the last load or sync."""
+        collection = self.__collection
+
+        update = self._changes(array_operators=not collection.write_behind)
+        snapshot = _snapshot(self.__data)
+
+        if update:
+            await collection.apply(self._id, update)
+
+        # Changes made while we were waiting are kept as dirty.
+        original = self.__original
+        for key in {k for fields in update.values() for k in fields}:
+            if key in snapshot:
+                original[key] = snapshot[key]
+            else:
+                original.pop(key, None)
 
     def delete(self):
         return self.__collection.delete(self._id)
 
 
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    size: int
+    max_size: Optional[int]
+
+
 class LRUCache:
-    def __init__(self, max_size=None):
-        self.max_size = max_size
-        self.__container = deque()
-        self.__map = dict()
+    """
+    Least recently used cache with optional per-entry TTL.
+
+    Entries are kept in an OrderedDict (most recent last), so lookups,
+    inserts and evictions are all O(1).
+    """
+
+    __slots__ = ('max_size', 'ttl', 'hits', 'misses', 'evictions', 'expirations', '__data')
 
-    def _reallocate(self):
-        self.__map = dict()
-        if len(self.__container) > 0:
-            for key, value in enumerate(self.__container):
-                self.__map[value[0]] = key
+    def __init__(self, max_size=None, *, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        # key -> (value, expires_at)
+        self.__data = OrderedDict()
+
+    def __len__(self):
+        return len(self.__data)
+
+    def __contains__(self, key):
+        return self.peek(key) is not MISSING
+
+    @property
+    def stats(self):
+        return CacheStats(
+            self.hits,
+            self.misses,
+            self.evictions,
+            self.expirations,
+            len(self.__data),
+            self.max_size,
+        )
+
+    def _is_expired(self, key, expires_at):
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.__data[key]
+            self.expirations += 1
+            return True
+        return False
+
+    def peek(self, key):
+        """Returns the value without touching its recency or the counters."""
+        entry = self.__data.get(key)
+        if entry is None or self._is_expired(key, entry[1]):
+            return MISSING
+        return entry[0]
 
     def get(self, key):
-        if key in self.__map:
-            value = self.__container[self.__map[key]]
-            self.__container.remove(value)
-            self.__container.appendleft(value)
-            self._reallocate()
+        entry = self.__data.get(key)
+        if entry is None or self._is_expired(key, entry[1]):
+            self.misses += 1
+            return MISSING
 
-            return value[1]
+        self.__data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
 
-        return MISSING
+    def insert(self, key, value, *, ttl=MISSING):
+        if ttl is MISSING:
+            ttl = self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
 
-    def insert(self, key, value):
-        if key in self.__map:
-            index = self.__map[key]
-            self.__container[index] = (key, value)
-        else:
-            if len(self.__container) == self.max_size:
-                self.__container.pop()
-            self.__container.appendleft((key, value))
+        data = self.__data
+        if key in data:
+            data.move_to_end(key)
+        elif self.max_size is not None and len(data) >= self.max_size:
+            data.popitem(last=False)
+            self.evictions += 1
 
-        self._reallocate()
+        data[key] = (value, expires_at)
 
         return value
 
     def delete(self, key):
-        try:
-            self.__container.remove(self.__container[self.__map[key]])
-            self._reallocate()
-        except KeyError:
+        self.__data.pop(key, None)
+
+    def clear(self, *, keep=()):
+        """Removes every entry, except the keys in keep."""
+        data = self.__data
+        if not keep:
+            data.clear()
             return
 
+        for key in [key for key in data if key not in keep]:
+            del data[key]
 
-class CollectionManager:
-    __slots__ = ('__collection', '__cache', 'template')
 
-    def __init__(self, *, collection, template=None):
+class _PendingWrite:
+    """The writes to a single document, coalesced until the next flush."""
+
+    __slots__ = ('set', 'inc', 'unset', 'upsert', 'replace', 'delete')
+
+    def __init__(self):
+        self.set = {}
+        self.inc = {}
+        self.unset = set()
+        self.upsert = False
+        # The document was deleted and created again, so replace it.
+        self.replace = False
+        self.delete = False
+
+    def merge(self, operation, data, *, upsert=False):
+        if self.delete:
+            self.delete = False
+            self.replace = True
+
+        self.upsert = self.upsert or upsert
+
+        if operation == 'set':
+            for k, v in data.items():
+                if k != '_id':
+                    self.inc.pop(k, None)
+                    self.unset.discard(k)
+                    self.set[k] = v
+
+        elif operation == 'unset':
+            for k in data:
+                self.set.pop(k, None)
+                self.inc.pop(k, None)
+                if not self.replace:
+                    self.unset.add(k)
+
+        elif operation == 'inc':
+            for k, v in data.items():
+                self.unset.discard(k)
+                if k in self.set or self.replace:
+                    self.set[k] = self.set.get(k, 0) + v
+                else:
+                    self.inc[k] = self.inc.get(k, 0) + v
+
+    def mark_deleted(self):
+        self.set = {}
+        self.inc = {}
+        self.unset = set()
+        self.upsert = False
+        self.replace = False
+        self.delete = True
+
+    def combine(self, newer):
+        """Returns this write followed by the newer one."""
+        if newer.delete or newer.replace:
+            return newer
+
+        self.merge('set', newer.set, upsert=newer.upsert)
+        self.merge('unset', newer.unset)
+        self.merge('inc', newer.inc)
+        return self
+
+    def to_operation(self, id):
+        if self.delete:
+            return Write('delete', id)
+
+        if self.replace:
+            return Write('replace', id, {'_id': id, **self.set}, upsert=True)
+
+        update = {}
+        if self.set:
+            update['$set'] = self.set
+        if self.inc:
+            update['$inc'] = self.inc
+        if self.unset:
+            update['$unset'] = dict.fromkeys(self.unset, '')
+        return Write('update', id, update, upsert=self.upsert)
+
+
+class CollectionManager:
+    __slots__ = (
+        '__collection',
+        '__cache',
+        '__pending',
+        '__writes',
+        '__flusher',
+        '__flush_event',
+        '__prefetched',
+        '__watcher',
+        'template',
+        'negative_ttl',
+        'coalesced',
+        'write_behind',
+        'flush_interval',
+        'flush_batch_size',
+        'prefetch_hits',
+        'invalidations',
+        'id_type',
+        'legacy_ids',
+    )
+
+    def __init__(
+        self,
+        *,
+        collection,
+        template=None,
+        cache_size=500,
+        cache_ttl=None,
+        negative_ttl=300,
+        write_behind=False,
+        flush_interval=5,
+        flush_batch_size=100,
+        id_type=str,
+        legacy_ids=False,
+    ):
         if template is None:
             template = {}
-        self.__cache = LRUCache(500)
+        self.__cache = LRUCache(cache_size, ttl=cache_ttl)
         self.__collection = collection
         self.template = template
 
+        # The type of the _ids (str or int). With legacy_ids, documents
+        # still keyed by str(id) are found too, and are copied to the
+        # new key when loaded (see kaibot.scripts.migrate_ids).
+        self.id_type = id_type
+        self.legacy_ids = legacy_ids
+
+        # Missing documents are cached for negative_ttl seconds.
+        self.negative_ttl = negative_ttl
+
+        # id -> task of the find_one in flight for it.
+        self.__pending = {}
+        # Number of finds that joined a find_one already in flight.
+        self.coalesced = 0
+
+        # When write_behind is set, writes are applied to the cached
+        # documents right away and sent in a single bulk_write every
+        # flush_interval seconds, or once flush_batch_size documents
+        # are pending.
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+
+        # id -> _PendingWrite
+        self.__writes = {}
+        self.__flusher = None
+        self.__flush_event = None
+
+        # Prefetched ids that weren't looked up yet.
+        self.__prefetched = set()
+        # Number of finds served by a prefetched entry.
+        self.prefetch_hits = 0
+
+        self.__watcher = None
+        # Number of cached entries changed by the stream. The changes
+        # don't say who made them, so the echo of one of our writes
+        # counts too (and is applied) if the entry changed again since.
+        self.invalidations = 0
+
+    # WRITE BEHIND
+
+    def _queue_write(self, id, operation, data, *, upsert=False):
+        write = self.__writes.get(id)
+        if write is None:
+            write = self.__writes[id] = _PendingWrite()
+
+        if operation == 'delete':
+            write.mark_deleted()
+        else:
+            write.merge(operation, data, upsert=upsert)
+
+        if self.__flusher is None or self.__flusher.done():
+            self.__flush_event = asyncio.Event()
+            self.__flusher = asyncio.ensure_future(self._flush_loop())
+
+        if len(self.__writes) >= self.flush_batch_size:
+            self.__flush_event.set()
+
+    async def _flush_loop(self):
+        while self.__writes:
+            try:
+                await asyncio.wait_for(self.__flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.__flush_event.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                log.error('Failed to flush the pending writes.', exc_info=True)
+
+    async def flush(self):
+        """Sends the pending writes. Returns how many documents were written."""
+        if not self.__writes:
+            return 0
+
+        writes, self.__writes = self.__writes, {}
+        operations = [write.to_operation(id) for id, write in writes.items()]
+
+        try:
+            await self.__collection.bulk_write(operations)
+        except BulkWriteError:
+            # These would fail again, don't retry them.
+            raise
+        except BaseException:
+            # Put them back for the next flush, keeping newer writes.
+            for id, write in writes.items():
+                newer = self.__writes.get(id)
+                self.__writes[id] = write if newer is None else write.combine(newer)
+            raise
+
+        return len(operations)
+
+    # INVALIDATION
+
+    def start_watching(self, *, retry_after=5):
+        """
+        Keeps the cache in sync with the changes made by other writers
+        (e.g. other shard processes), using the backend's watch().
+        """
+        if self.__watcher is None or self.__watcher.done():
+            self.__watcher = asyncio.ensure_future(self._watch_loop(retry_after))
+
+    async def _watch_loop(self, retry_after):
+        while True:
+            try:
+                async for change in self.__collection.watch():
+                    if change is None:
+                        # The stream is open. Changes made before it are
+                        # lost, so nothing cached until now can be trusted,
+                        # except our pending writes (they're newer).
+                        self.__cache.clear(keep=self.__writes)
+                    else:
+                        self._apply_change(change)
+            except NotImplementedError:
+                log.warning('The database backend does not support watching changes.')
+                return
+            except Exception:
+                log.error('Watching changes failed, retrying.', exc_info=True)
+
+            await asyncio.sleep(retry_after)
+
+    def _apply_change(self, change):
+        id = change.id
+
+        # Our pending writes are newer than this change.
+        if id in self.__writes:
+            return
+
+        cached = self.__cache.peek(id)
+        if cached is MISSING:
+            return
+
+        if change.kind == 'delete' or change.document is None:
+            if cached is NOT_FOUND:
+                # Nothing changed, usually the echo of our delete.
+                return
+            self.invalidations += 1
+            self.__cache.delete(id)
+            return
+
+        if cached is not NOT_FOUND and dict(cached) == change.document:
+            # Nothing changed, usually the echo of our last write.
+            return
+
+        self.invalidations += 1
+        if cached is NOT_FOUND:
+            self.__cache.insert(id, Document(change.document, self))
+        else:
+            cached._reload(change.document)
+
+    async def close(self):
+        """Stops the flusher and sends everything that is still pending."""
+        if self.__watcher is not None:
+            self.__watcher.cancel()
+
+        flusher = self.__flusher
+        if flusher is not None and not flusher.done():
+            flusher.cancel()
+            try:
+                await flusher
+            except asyncio.CancelledError:
+                pass
+
+        await self.flush()
+
+    # OPERATIONS
+
     async def new(self, id):
+        id = self._key(id)
+
         template = self.template.copy()
-        template.update({'_id': str(id)})
+        template.update({'_id': id})
 
-        data = await self.__collection.insert_one(template)
-        return self.__cache.insert(id, Document(data, self))
+        if self.write_behind:
+            self._queue_write(id, 'set', template, upsert=True)
+        else:
+            await self.__collection.insert_one(template)
+
+        return self.__cache.insert(id, Document(template, self))
 
     async def delete(self, id):
-        id = str(id)
+        id = self._key(id)
 
-        await self.__collection.delete_one({'_id': id})
-        self.__cache.delete(id)
+        # Otherwise find() would migrate the legacy document again.
+        ids = (id, str(id)) if self.legacy_ids else (id,)
 
-    async def find(self, id):
-        id = str(id)
+        for key in ids:
+            if self.write_behind:
+                self._queue_write(key, 'delete', None)
+            else:
+                await self.__collection.delete_one(key)
 
-        cached = self.__cache.get(id)
+        self.__cache.insert(id, NOT_FOUND, ttl=self.negative_ttl)
+
+    def _key(self, id):
+        return id if type(id) is self.id_type else self.id_type(id)
+
+    async def _find_legacy(self, id):
+        """Finds the document by id or str(id), migrating the latter."""
+        data = None
+        async for candidate in self.__collection.find({'_id': {'$in': [id, str(id)]}}):
+            if data is None or candidate['_id'] == id:
+                data = candidate
+
+        if data is None or data['_id'] == id:
+            return data
+
+        # Copy it to the new key, unless someone (the migration script
+        # or another process) already did, then use whatever is there.
+        fields = {k: v for k, v in data.items() if k != '_id'}
+        await self.__collection.update_one(id, {'$setOnInsert': fields}, upsert=True)
+        return await self.__collection.find_one(id)
+
+    async def _fetch(self, id):
+        if self.legacy_ids:
+            data = await self._find_legacy(id)
+        else:
+            data = await self.__collection.find_one(id)
+
+        # A write may have cached a newer value while we were waiting.
+        cached = self.__cache.peek(id)
         if cached is not MISSING:
-            return cached
+            return None if cached is NOT_FOUND else cached
 
-        data = await self.__collection.find_one({'_id': id})
         if not data:
-            return self.__cache.insert(id, None)
+            self.__cache.insert(id, NOT_FOUND, ttl=self.negative_ttl)
+            return None
         return self.__cache.insert(id, Document(data, self))
 
+    def _pop_pending(self, id, task):
+        if self.__pending.get(id) is task:
+            del self.__pending[id]
+
+    def get_cached(self, id):
+        """
+        Returns the cached document (None if it doesn't exist), or
+        MISSING if it isn't cached. Never loads it.
+        """
+        cached = self.__cache.peek(self._key(id))
+        return None if cached is NOT_FOUND else cached
+
+    async def find(self, id):
+        id = self._key(id)
+
+        cached = self.__cache.get(id)
+
+        if self.__prefetched and id in self.__prefetched:
+            self.__prefetched.discard(id)
+            if cached is not MISSING:
+                self.prefetch_hits += 1
+
+        if cached is not MISSING:
+            return None if cached is NOT_FOUND else cached
+
+        task = self.__pending.get(id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(id))
+            task.add_done_callback(lambda t: self._pop_pending(id, t))
+            self.__pending[id] = task
+        else:
+            self.coalesced += 1
+
+        # Shield it, so a cancelled caller doesn't cancel the others.
+        return await asyncio.shield(task)
+
+    async def prefetch(self, ids, *, batch_size=1000):
+        """
+        Loads the documents with batched $in queries, caching the missing
+        ones as negative entries. Ids already cached or being fetched are
+        skipped. Returns how many ids were cached.
+
+        The whole documents are loaded, since find() serves them as is.
+        """
+        cache = self.__cache
+        ids = [
+            id
+            for id in map(self._key, ids)
+            if id not in self.__pending and cache.peek(id) is MISSING
+        ]
+
+        # Don't evict what we've just loaded.
+        if cache.max_size is not None:
+            ids = ids[: max(cache.max_size - len(cache), 0)]
+
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i : i + batch_size]
+            missing = set(batch)
+
+            query = {'_id': {'$in': batch}}
+            if self.legacy_ids:
+                query['_id']['$in'] = batch + [str(id) for id in batch]
+
+            async for data in self.__collection.find(query, batch_size=batch_size):
+                id = data['_id']
+                if type(id) is not self.id_type:
+                    # Not migrated yet, leave it to find().
+                    missing.discard(self._key(id))
+                    continue
+
+                missing.discard(id)
+                if cache.peek(id) is MISSING:
+                    cache.insert(id, Document(data, self))
+
+            for id in missing:
+                if cache.peek(id) is MISSING:
+                    cache.insert(id, NOT_FOUND, ttl=self.negative_ttl)
+
+            self.__prefetched.update(batch)
+
+        return len(ids)
+
     def _update_doc(self, doc, operation, data):
         if operation == 'inc':
             for k, v in data.items():
@@ -136,48 +717,121 @@ class CollectionManager:
                 doc[k] = v
 
     async def update(self, id, operation, data):
-        id = str(id)
+        id = self._key(id)
 
         doc = await self.find(id)
 
         if doc:
             self._update_doc(doc, operation, data)
 
-            await self.__collection.update_one({'_id': id}, {f'${operation}': data})
+            if self.write_behind:
+                self._queue_write(id, operation, data)
+            else:
+                await self.__collection.update_one(id, {f'${operation}': data})
 
+            doc._mark_clean(data)
             return self.__cache.insert(id, doc)
         else:
             template = self.template.copy()
             template.update({'_id': id})
             self._update_doc(template, operation, data)
 
-            await self.__collection.insert_one(template)
+            if self.write_behind:
+                self._queue_write(id, 'set', template, upsert=True)
+            else:
+                await self.__collection.insert_one(template)
 
             return self.__cache.insert(id, Document(template, self))
 
-    async def all(self):
-        cursor = self.__collection.find({})
-        async for doc in cursor:
-            yield Document(doc, self)
+    async def apply(self, id, update):
+        """
+        Sends an update document as is. Only $set, $unset and $inc are
+        supported in write behind mode.
+        """
+        id = self._key(id)
+
+        if not self.write_behind:
+            await self.__collection.update_one(id, update)
+            return
+
+        for operator, data in update.items():
+            if operator not in ('$set', '$unset', '$inc'):
+                raise ValueError(f'{operator} is not supported in write behind mode.')
+            self._queue_write(id, operator[1:], data)
+
+    @property
+    def cache_stats(self):
+        return self.__cache.stats
+
+    def _wrapper(self, raw, fields):
+        if fields is not None:
+            return lambda data: tuple(data.get(field) for field in fields)
+        if raw:
+            return None
+        return lambda data: Document(data, self)
+
+    async def all(self, filter=None, projection=None, *, batch_size=None, raw=False, fields=None):
+        """
+        Streams the documents matching filter.
+
+        With raw, plain dicts are yielded instead of Documents. With
+        fields, tuples of these fields are yielded (and only they are
+        loaded).
+        """
+        if fields is not None:
+            projection = dict.fromkeys(fields, 1)
+
+        wrap = self._wrapper(raw, fields)
+        cursor = self.__collection.find(filter or {}, projection, batch_size=batch_size)
+
+        if wrap is None:
+            async for data in cursor:
+                yield data
+        else:
+            async for data in cursor:
+                yield wrap(data)
+
+    async def all_chunks(self, filter=None, projection=None, *, chunk_size=500, **kwargs):
+        """Like all, but yields lists of up to chunk_size items."""
+        chunk = []
+        async for item in self.all(filter, projection, batch_size=chunk_size, **kwargs):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
 
     async def ping(self):
         start = time.perf_counter()
-        await self.__collection.database.command('ping')
+        await self.__collection.ping()
         return time.perf_counter() - start
 
 
 class DatabaseManager:
-    __slots__ = ('__db', '__cache')
+    __slots__ = ('__backend', '__cache')
 
-    def __init__(self, name, *, client):
+    def __init__(self, backend):
         self.__cache = {}
-        self.__db = client[name]
+        self.__backend = backend
 
-    def create_collection(self, name, template=None):
-        col = CollectionManager(collection=self.__db[name], template=template)
+    def create_collection(self, name, template=None, **options):
+        """Creates a CollectionManager, options are passed to it."""
+        collection = self.__backend.collection(name)
+        col = CollectionManager(collection=collection, template=template, **options)
         self.__cache[name.casefold()] = col
         return col
 
+    async def close(self):
+        for col in self.__cache.values():
+            try:
+                await col.close()
+            except Exception:
+                log.error('Failed to flush a collection on close.', exc_info=True)
+
+        await self.__backend.close()
+
     def __getattr__(self, attr):
         if attr.casefold() in self.__cache:
             return self.__cache[attr.casefold()]
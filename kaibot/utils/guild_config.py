@@ -0,0 +1,53 @@
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+
+class PrefixMatcher:
+    """
+    Matches the longest prefix a message content starts with.
+
+    Prefixes are grouped by their first character, so most messages are
+    rejected with a single dict lookup.
+    """
+
+    __slots__ = ('prefixes', 'table', 'matches_empty')
+
+    def __init__(self, prefixes):
+        self.prefixes = tuple(sorted(set(prefixes), key=len, reverse=True))
+
+        # An empty prefix (used in DMs) matches anything.
+        self.matches_empty = '' in self.prefixes
+
+        table = {}
+        for prefix in self.prefixes:
+            if prefix:
+                table.setdefault(prefix[0], []).append(prefix)
+        self.table = {char: tuple(prefixes) for char, prefixes in table.items()}
+
+    def could_match(self, content) -> bool:
+        """Cheaper than calling, but may give false positives."""
+        return self.matches_empty or content[:1] in self.table
+
+    def __call__(self, content) -> Optional[str]:
+        candidates = self.table.get(content[:1])
+        if candidates is not None:
+            for prefix in candidates:
+                if content.startswith(prefix):
+                    return prefix
+
+        return '' if self.matches_empty else None
+
+
+class GuildConfig(NamedTuple):
+    """The guild settings resolved for a single message."""
+
+    # None in DMs.
+    guild_id: Optional[int]
+    # Configured prefixes, or the default ones. Mentions not included.
+    prefixes: tuple[str, ...]
+    language: str
+    # Matches the prefixes above and both bot mentions.
+    matcher: PrefixMatcher
+
+
+current_guild_config = ContextVar('current_guild_config', default=None)
@@ -1,5 +1,8 @@
 import asyncio
-from discord import http
+import contextvars
+from collections import Counter
+
+from discord import HTTPException, http
 
 
 def ack_interaction(bot, interaction_id, interaction_token):
@@ -15,29 +18,141 @@ def ack_interaction(bot, interaction_id, interaction_token):
     return bot.http.request(route, json=payload)
 
 
-def wait_for_click(bot, message_id, member_id, *, timeout=60):
-    async def inner():
-        while True:
-            event = await bot.wait_for('socket_response', timeout=60)
+class Listener:
+    __slots__ = ('key', 'callback', 'on_timeout', 'deadline', 'context', '_router')
+
+    def __init__(self, router, key, callback, on_timeout):
+        self._router = router
+        self.key = key
+        self.callback = callback
+        self.on_timeout = on_timeout
+        self.deadline = None
+        # The callbacks run with the language and config of the listener.
+        self.context = contextvars.copy_context()
+
+    def cancel(self):
+        self._router._remove(self)
+
+
+class InteractionRouter:
+    """
+    Parses every INTERACTION_CREATE once and hands the clicked button to
+    the listener registered for that (message, user).
+
+    Listeners are plain callbacks with a deadline in the bot's scheduler,
+    so nothing runs while nobody clicks. The gateway events are only
+    listened to while there are listeners, since discord.py creates a
+    task for each event a listener gets.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        # (message_id, user_id) -> Listener
+        self.__listeners = {}
+        # message_id -> number of listeners, the messages we ack clicks on.
+        self.__messages = Counter()
+
+    def destroy(self):
+        self.bot.remove_listener(self.on_socket_response)
+        for listener in tuple(self.__listeners.values()):
+            listener.cancel()
+        self.__listeners = {}
+        self.__messages = Counter()
+
+    def __len__(self):
+        return len(self.__listeners)
+
+    def _remove(self, listener):
+        if self.__listeners.get(listener.key) is not listener:
+            return False
+
+        del self.__listeners[listener.key]
+        listener.deadline.cancel()
+        if not self.__listeners:
+            self.bot.remove_listener(self.on_socket_response)
 
-            if event['t'] != 'INTERACTION_CREATE':
-                continue
+        message_id = listener.key[0]
+        self.__messages[message_id] -= 1
+        if self.__messages[message_id] <= 0:
+            del self.__messages[message_id]
+        return True
 
-            payload = event['d']
+    def _timeout(self, listener):
+        if self._remove(listener) and listener.on_timeout is not None:
+            listener.context.run(listener.on_timeout)
 
-            await ack_interaction(bot, payload['id'], payload['token'])
+    async def on_socket_response(self, event):
+        if event['t'] != 'INTERACTION_CREATE':
+            return
 
-            try:
-                if payload['message']['id'] != str(message_id):
-                    continue
+        payload = event['d']
 
-                if payload['member']['user']['id'] != str(member_id):
-                    continue
-            except KeyError as e:
-                continue
+        try:
+            message_id = int(payload['message']['id'])
+            user = payload['member']['user'] if 'member' in payload else payload['user']
+            user_id = int(user['id'])
+        except KeyError:
+            return
 
-            button_id = payload['data']['custom_id']
+        if message_id not in self.__messages:
+            return
 
-            return button_id
+        listener = self.__listeners.get((message_id, user_id))
+        if listener is not None:
+            self._remove(listener)
 
-    return asyncio.wait_for(inner(), timeout=timeout)
+        try:
+            await ack_interaction(self.bot, payload['id'], payload['token'])
+        except HTTPException:
+            pass
+        finally:
+            if listener is not None:
+                data = payload['data']
+                listener.context.run(listener.callback, data['custom_id'], *data.get('values', ()))
+
+    def listen(self, message_id, member_id, callback, *, timeout=60, on_timeout=None):
+        """
+        Calls `callback(custom_id)` on the next click of the member, or
+        `on_timeout()` if there's none in `timeout` seconds. A previous
+        listener for the same message and member times out.
+
+        Select menus also pass the selected values, `callback(custom_id, *values)`.
+        """
+        message_id = int(message_id)
+        key = (message_id, int(member_id))
+
+        previous = self.__listeners.get(key)
+        if previous is not None:
+            self._timeout(previous)
+
+        if not self.__listeners:
+            self.bot.add_listener(self.on_socket_response)
+
+        listener = Listener(self, key, callback, on_timeout)
+        listener.deadline = self.bot.scheduler.call_later(timeout, self._timeout, listener)
+        self.__listeners[key] = listener
+        self.__messages[message_id] += 1
+        return listener
+
+    async def wait_for_click(self, message_id, member_id, *, timeout=60):
+        future = self.bot.loop.create_future()
+
+        def on_click(custom_id, *values):
+            if not future.done():
+                future.set_result(custom_id)
+
+        def on_timeout():
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+        listener = self.listen(
+            message_id, member_id, on_click, timeout=timeout, on_timeout=on_timeout
+        )
+        try:
+            return await future
+        finally:
+            listener.cancel()
+
+
+def wait_for_click(bot, message_id, member_id, *, timeout=60):
+    return bot.interactions.wait_for_click(message_id, member_id, timeout=timeout)
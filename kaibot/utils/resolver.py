@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import NamedTuple
+
+import aiohttp
+from yarl import URL
+
+from .database import MISSING, LRUCache
+
+log = logging.getLogger('kaibot.resolver')
+
+REDIRECT_STATUSES = frozenset({301, 302, 303, 307, 308})
+
+
+class TooManyRedirects(Exception):
+    pass
+
+
+class Hop(NamedTuple):
+    status: int
+    url: str
+
+
+class RedirectResolver:
+    """
+    Follows the redirects of a link one hop at a time, with HEAD requests
+    (GET if the server doesn't like HEAD), never reading the bodies.
+
+    The chains are cached, and each host gets at most `per_host` requests
+    at the same time.
+    """
+
+    def __init__(
+        self,
+        session,
+        *,
+        max_redirects=30,
+        per_host=2,
+        timeout=15,
+        cache_size=512,
+        cache_ttl=600,
+    ):
+        self.session = session
+        self.max_redirects = max_redirects
+        self.per_host = per_host
+        self.timeout = timeout
+        # url -> tuple of hops
+        self.cache = LRUCache(cache_size, ttl=cache_ttl)
+        # host -> [semaphore, requests using it]
+        self.__hosts = {}
+
+    @asynccontextmanager
+    async def _host_limit(self, host):
+        entry = self.__hosts.get(host)
+        if entry is None:
+            entry = self.__hosts[host] = [asyncio.Semaphore(self.per_host), 0]
+
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.__hosts[host]
+
+    async def _request(self, method, url):
+        async with self._host_limit(url.host):
+            async with self.session.request(method, url, allow_redirects=False) as response:
+                if method == 'GET':
+                    # Drops the connection instead of reading the body.
+                    response.close()
+                return response.status, response.headers.get('Location')
+
+    async def _hop(self, url):
+        try:
+            status, location = await self._request('HEAD', url)
+        except aiohttp.ClientConnectorError:
+            raise
+        except aiohttp.ClientError as e:
+            log.debug(f'HEAD {url} failed ({e!r}), trying GET.')
+        else:
+            # Some servers refuse (or break on) HEAD, but are fine with GET.
+            if status < 400:
+                return status, location
+
+        return await self._request('GET', url)
+
+    async def _follow(self, url):
+        hops = []
+        for _ in range(self.max_redirects + 1):
+            status, location = await self._hop(url)
+            hops.append(Hop(status, str(url)))
+
+            if status not in REDIRECT_STATUSES or location is None:
+                return tuple(hops)
+
+            try:
+                next_url = url.join(URL(location))
+            except ValueError:
+                return tuple(hops)
+            if next_url.scheme not in ('http', 'https'):
+                return tuple(hops)
+            url = next_url
+
+        raise TooManyRedirects(f'More than {self.max_redirects} redirects.')
+
+    async def resolve(self, url):
+        """
+        Returns the hops from `url` to the final page, including both.
+        Raises asyncio.TimeoutError if the whole chain takes more than
+        `timeout` seconds.
+        """
+        url = URL(url)
+        hops = self.cache.get(str(url))
+        if hops is not MISSING:
+            return hops
+
+        hops = await asyncio.wait_for(self._follow(url), self.timeout)
+        return self.cache.insert(str(url), hops)
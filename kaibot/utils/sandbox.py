@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import multiprocessing
+
+try:
+    import resource
+except ImportError:  # Not available on Windows.
+    resource = None
+
+log = logging.getLogger('kaibot.sandbox')
+
+# Spawned workers don't inherit the bot's threads, sockets or memory.
+_context = multiprocessing.get_context('spawn')
+
+
+class SandboxError(Exception):
+    """The worker died while running the function, usually out of memory."""
+
+
+def _worker_main(conn, memory_limit):
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    while True:
+        try:
+            func, args = conn.recv()
+        except EOFError:
+            return
+
+        try:
+            response = (True, func(*args))
+        except Exception as e:
+            response = (False, e)
+
+        try:
+            conn.send(response)
+        except MemoryError:
+            # Exiting lets the parent see the worker died.
+            return
+
+
+class _Worker:
+    __slots__ = ('process', 'conn')
+
+    def __init__(self, memory_limit):
+        self.conn, child_conn = _context.Pipe()
+        self.process = _context.Process(
+            target=_worker_main, args=(child_conn, memory_limit), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+
+
+class ProcessSandbox:
+    """
+    Runs untrusted functions in worker processes, with an address space
+    limit on each worker. A worker that times out is killed and replaced.
+
+    The functions and their arguments must be picklable.
+    """
+
+    def __init__(self, workers=2, *, memory_limit=None):
+        self.size = workers
+        self.memory_limit = memory_limit
+        self.__workers = set()
+        self.__idle = None
+
+    def __start(self):
+        self.__idle = asyncio.Queue()
+        for _ in range(self.size):
+            self.__add_worker()
+
+    def __add_worker(self):
+        worker = _Worker(self.memory_limit)
+        self.__workers.add(worker)
+        self.__idle.put_nowait(worker)
+
+    async def __replace(self, worker):
+        log.debug(f'Replacing sandbox worker {worker.process.pid}.')
+        self.__workers.discard(worker)
+        await asyncio.get_running_loop().run_in_executor(None, worker.kill)
+        if self.__idle is not None:
+            self.__add_worker()
+
+    def close(self):
+        for worker in self.__workers:
+            worker.kill()
+        self.__workers = set()
+        self.__idle = None
+
+    @staticmethod
+    async def _recv(conn):
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = conn.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            loop.remove_reader(fd)
+        return conn.recv()
+
+    async def run(self, func, *args, timeout):
+        """
+        Runs `func(*args)` in a worker and returns its result, or raises
+        its exception. Raises asyncio.TimeoutError after `timeout` seconds.
+        """
+        if self.__idle is None:
+            self.__start()
+
+        worker = await self.__idle.get()
+        try:
+            worker.conn.send((func, args))
+            ok, value = await asyncio.wait_for(self._recv(worker.conn), timeout)
+        except asyncio.TimeoutError:
+            await self.__replace(worker)
+            raise
+        except (EOFError, OSError):
+            await self.__replace(worker)
+            raise SandboxError('The worker died.') from None
+        except BaseException:
+            # Cancelled, the worker is still busy.
+            await self.__replace(worker)
+            raise
+        else:
+            self.__idle.put_nowait(worker)
+
+        if not ok:
+            raise value
+        return value
@@ -0,0 +1,99 @@
+import heapq
+import logging
+
+log = logging.getLogger('kaibot.scheduler')
+
+
+class Deadline:
+    __slots__ = ('when', 'callback', 'args', 'cancelled', '_scheduler')
+
+    def __init__(self, scheduler, when, callback, args):
+        self._scheduler = scheduler
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+    def cancel(self):
+        if not self.cancelled:
+            self.cancelled = True
+            self._scheduler._cancelled(self)
+
+
+class DeadlineScheduler:
+    """
+    Runs callbacks after a delay with a single timer on the event loop,
+    instead of one timer (and usually one task) per timeout.
+
+    Cancelled deadlines are skipped when they reach the top of the heap,
+    or dropped all at once when they're most of it.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.__heap = []
+        self.__cancelled = 0
+        self.__handle = None
+        self.__handle_when = None
+
+    def __len__(self):
+        return len(self.__heap) - self.__cancelled
+
+    def call_later(self, delay, callback, *args):
+        deadline = Deadline(self, self.loop.time() + delay, callback, args)
+        heapq.heappush(self.__heap, deadline)
+        if self.__handle_when is None or deadline.when < self.__handle_when:
+            self.__arm(deadline.when)
+        return deadline
+
+    def close(self):
+        if self.__handle is not None:
+            self.__handle.cancel()
+        for deadline in self.__heap:
+            deadline.cancelled = True
+        self.__heap = []
+        self.__cancelled = 0
+        self.__handle = self.__handle_when = None
+
+    # INTERNALS
+
+    def _cancelled(self, deadline):
+        self.__cancelled += 1
+        if self.__cancelled > 64 and self.__cancelled > len(self.__heap) // 2:
+            # In place, __run may be iterating it.
+            self.__heap[:] = [d for d in self.__heap if not d.cancelled]
+            heapq.heapify(self.__heap)
+            self.__cancelled = 0
+
+    def __arm(self, when):
+        if self.__handle is not None:
+            self.__handle.cancel()
+        self.__handle = self.loop.call_at(when, self.__run)
+        self.__handle_when = when
+
+    def __run(self):
+        self.__handle = self.__handle_when = None
+
+        heap = self.__heap
+        now = self.loop.time()
+        while heap and heap[0].when <= now:
+            deadline = heapq.heappop(heap)
+            if deadline.cancelled:
+                self.__cancelled -= 1
+                continue
+
+            deadline.cancelled = True
+            try:
+                deadline.callback(*deadline.args)
+            except Exception:
+                log.exception(f'Exception in deadline callback {deadline.callback!r}')
+
+        while heap and heap[0].cancelled:
+            heapq.heappop(heap)
+            self.__cancelled -= 1
+
+        if heap:
+            self.__arm(heap[0].when)